@@ -0,0 +1,156 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Dict, Optional, Tuple
+
+import numpy as np
+
+from qdrant_client.http import models
+from qdrant_client.http.exceptions import UnexpectedResponse
+
+# Configuration
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", str(6 * 3600)))
+ANSWER_CACHE_MAX_DISTANCE = float(os.environ.get("ANSWER_CACHE_MAX_DISTANCE", "0.08"))
+INDEX_VERSION_CHECK_INTERVAL = float(os.environ.get("INDEX_VERSION_CHECK_INTERVAL", "30"))
+
+# The version lives in a one-point sibling collection, so ingestion on any host reaches every app
+# instance and the sentinel never shows up in searches of the real collection
+INDEX_VERSION_POINT_ID = str(uuid.uuid5(uuid.NAMESPACE_URL, "rbi-circulars/index-version"))
+
+
+def index_version_collection(collection_name: str) -> str:
+    return f"{collection_name}_meta"
+
+
+def bump_index_version(qdrant_client, collection_name: str) -> str:
+    """Record in Qdrant that the collection was re-indexed, invalidating cached answers."""
+    meta_collection = index_version_collection(collection_name)
+    try:
+        qdrant_client.get_collection(meta_collection)
+    except (UnexpectedResponse, ValueError):
+        qdrant_client.create_collection(
+            collection_name=meta_collection,
+            vectors_config=models.VectorParams(size=1, distance=models.Distance.DOT)
+        )
+    version = uuid.uuid4().hex
+    qdrant_client.upsert(
+        collection_name=meta_collection,
+        points=[models.PointStruct(id=INDEX_VERSION_POINT_ID, vector=[1.0],
+                                   payload={"index_version": version, "updated_at": time.time()})]
+    )
+    return version
+
+
+def read_index_version(qdrant_client, collection_name: str) -> Optional[str]:
+    """The collection's current index version, or None before the first re-index."""
+    try:
+        points = qdrant_client.retrieve(index_version_collection(collection_name), ids=[INDEX_VERSION_POINT_ID])
+    except (UnexpectedResponse, ValueError):  # No metadata collection yet
+        return None
+    return points[0].payload.get("index_version") if points else None
+
+
+class SemanticAnswerCache:
+    """Answer cache keyed on query-embedding similarity plus the exact set of retrieved circulars.
+
+    Query vectors live in one preallocated float32 matrix so a lookup is a
+    single matrix-vector product over the occupied slots.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 max_distance: float = ANSWER_CACHE_MAX_DISTANCE,
+                 version_source: Optional[Callable[[], Optional[str]]] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        # Called on every lookup, so it must not block; e.g. a RefreshingCache over read_index_version
+        self.version_source = version_source
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._entries = OrderedDict()  # slot -> entry, least recently used first
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._version = version_source() if version_source is not None else None
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self) -> None:
+        """Drop everything if the index was re-indexed since the cache was filled."""
+        if self.version_source is None:
+            return
+        version = self.version_source()
+        if version != self._version:
+            self._version = version
+            self._clear()
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def _evict(self, slot: int) -> None:
+        del self._entries[slot]
+        self._free_slots.append(slot)
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query_vector: List[float], doc_ids: List[str]) -> Optional[Tuple[str, str]]:
+        """Return the cached (answer, html) for a similar query that retrieved the same circulars."""
+        with self._lock:
+            self._check_version()
+            if not self._entries:
+                self.misses += 1
+                return None
+            query = self._normalize(query_vector)
+            slots = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+            similarities = self._matrix[slots] @ query
+            now = time.time()
+            doc_key = tuple(doc_ids)
+            for i in np.argsort(-similarities):
+                if 1.0 - similarities[i] > self.max_distance:
+                    break
+                slot = int(slots[i])
+                entry = self._entries[slot]
+                if now - entry["created"] > self.ttl:
+                    self._evict(slot)
+                    continue
+                if entry["doc_ids"] == doc_key:
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    return entry["answer"], entry["html"]
+            self.misses += 1
+            return None
+
+    def store(self, query_vector: List[float], doc_ids: List[str], answer: str, html: str) -> None:
+        """Cache an answer, evicting the least recently used entry when full."""
+        with self._lock:
+            self._check_version()
+            query = self._normalize(query_vector)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, len(query)), dtype=np.float32)
+            if not self._free_slots:
+                self._evict(next(iter(self._entries)))
+            slot = self._free_slots.pop()
+            self._matrix[slot] = query
+            self._entries[slot] = {
+                "doc_ids": tuple(doc_ids),
+                "answer": answer,
+                "html": html,
+                "created": time.time()
+            }
+
+    def invalidate(self) -> None:
+        """Drop every cached answer."""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for this process."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
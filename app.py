@@ -5,13 +5,27 @@ from langchain_openai.chat_models import ChatOpenAI
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.agents import AgentFinish
+from langchain_core.load import dumps, loads
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langgraph.graph import END, Graph
 import os
+import re
+import json
+import time
 import uuid
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from firebase_auth import login, signup, logout, data_to_firebase
+from firebase_auth import (
+    login, signup, logout, data_to_firebase,
+    save_conversation_title, load_conversation_titles, get_conversation_messages
+)
 from datetime import datetime, timedelta
 import pytz
+from relevance import get_relevance_gate
+from news_cache import RefreshingCache
 
 load_dotenv()
 
@@ -109,105 +123,255 @@ st.markdown("""
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "6"))
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "4096"))
+NEWS_REFRESH_INTERVAL = float(os.getenv("NEWS_REFRESH_INTERVAL", "1800"))
+NEWS_TTL = float(os.getenv("NEWS_TTL", "1800"))
+NEWS_STALE_WHILE_REVALIDATE = os.getenv("NEWS_STALE_WHILE_REVALIDATE", "true").lower() in ("1", "true", "yes")
+NEWS_ARTICLE_KEYS = ("title", "summary", "url", "date", "source")
+NUM_SOURCES = 5
+AGENT_PROMPT_CACHE_PATH = os.getenv("AGENT_PROMPT_CACHE_PATH", ".cache/hub/openai-functions-agent.json")
+AGENT_PROMPT_FROM_HUB = os.getenv("AGENT_PROMPT_FROM_HUB", "false").lower() in ("1", "true", "yes")
 
 
 if not OPENAI_API_KEY or not TAVILY_API_KEY:
     st.error("Please set OPENAI_API_KEY and TAVILY_API_KEY in your .env file")
     st.stop()
 
-tools = [TavilySearchResults(max_results=5)]
-prompt = hub.pull("hwchase17/openai-functions-agent")
-llm = ChatOpenAI(model="gpt-3.5-turbo")
+@contextmanager
+def timed(label, timings):
+    """Record how long a startup step took."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[label] = time.perf_counter() - start
+
+def load_agent_prompt():
+    """The openai-functions-agent prompt, from disk if cached, else the hub, else the vendored copy."""
+    if os.path.exists(AGENT_PROMPT_CACHE_PATH):
+        with open(AGENT_PROMPT_CACHE_PATH, "r", encoding="utf-8") as f:
+            return loads(f.read())
+    if AGENT_PROMPT_FROM_HUB:
+        try:
+            prompt = hub.pull("hwchase17/openai-functions-agent")
+            os.makedirs(os.path.dirname(AGENT_PROMPT_CACHE_PATH), exist_ok=True)
+            with open(AGENT_PROMPT_CACHE_PATH, "w", encoding="utf-8") as f:
+                f.write(dumps(prompt))
+            return prompt
+        except Exception as e:
+            print(f"Could not pull the agent prompt from the hub, using the vendored copy: {str(e)}")
+    # Vendored copy of hwchase17/openai-functions-agent
+    return ChatPromptTemplate.from_messages([
+        ("system", "You are a helpful assistant"),
+        MessagesPlaceholder("chat_history", optional=True),
+        ("human", "{input}"),
+        MessagesPlaceholder("agent_scratchpad"),
+    ])
+
+@st.cache_resource
+def build_agent():
+    """Build the LLM, tools and compiled agent graph once per process rather than on every rerun."""
+    timings = {}
+    with timed("prompt", timings):
+        prompt = load_agent_prompt()
+    with timed("llm_and_tools", timings):
+        tools = [TavilySearchResults(max_results=5)]
+        llm = ChatOpenAI(model="gpt-3.5-turbo")
+    with timed("agent", timings):
+        agent_runnable = create_openai_functions_agent(llm, tools, prompt)
+        agent = RunnablePassthrough.assign(
+            agent_outcome=agent_runnable
+        )
+
+    def execute_tools(data):
+        agent_action = data.pop('agent_outcome')
+        tools_to_use = {t.name: t for t in tools}[agent_action.tool]
+        observation = tools_to_use.invoke(agent_action.tool_input)
+        data['intermediate_steps'].append((agent_action, observation))
+        return data
+
+    def should_continue(data):
+        if isinstance(data['agent_outcome'], AgentFinish):
+            return "exit"
+        else:
+            return "continue"
+
+    with timed("graph_compile", timings):
+        workflow = Graph()
+        workflow.add_node("agent", agent)
+        workflow.add_node("tools", execute_tools)
+        workflow.set_entry_point("agent")
+        workflow.add_conditional_edges(
+            "agent",
+            should_continue,
+            {
+                "continue": "tools",
+                "exit": END
+            }
+        )
+        workflow.add_edge('tools', 'agent')
 
-agent_runnable = create_openai_functions_agent(llm, tools, prompt)
+        chain = workflow.compile()
 
-agent = RunnablePassthrough.assign(
-    agent_outcome=agent_runnable
-)
+    print("Agent startup timings: " + ", ".join(f"{label}={seconds * 1000:.0f}ms" for label, seconds in timings.items()))
+    return llm, chain
 
-def execute_tools(data):
-    agent_action = data.pop('agent_outcome')
-    tools_to_use = {t.name: t for t in tools}[agent_action.tool]
-    observation = tools_to_use.invoke(agent_action.tool_input)
-    data['intermediate_steps'].append((agent_action, observation))
-    return data
-
-def should_continue(data):
-    if isinstance(data['agent_outcome'], AgentFinish):
-        return "exit"
-    else:
-        return "continue"
-
-workflow = Graph()
-workflow.add_node("agent", agent)
-workflow.add_node("tools", execute_tools)
-workflow.set_entry_point("agent")
-workflow.add_conditional_edges(
-    "agent",
-    should_continue,
-    {
-        "continue": "tools",
-        "exit": END
-    }
-)
-workflow.add_edge('tools', 'agent')
+llm, chain = build_agent()
 
-chain = workflow.compile()
+@st.cache_data(show_spinner=False, max_entries=4096)
+def summarize_first_message(first_message):
+    summary_prompt = f"Summarize the following message in 5 words or less: {first_message}"
+    
+    summary = llm.predict(summary_prompt)
+    return summary.strip()
 
 def summarize_conversation(messages):
     if not messages:
         return "New Conversation"
     
-    first_message = messages[0]["content"]
-    summary_prompt = f"Summarize the following message in 5 words or less: {first_message}"
-    
-    summary = llm.predict(summary_prompt)
-    return summary.strip()
+    return summarize_first_message(messages[0]["content"])
 
 def generate_three_line_summary(content):
     summary_prompt = f"Provide a three-line summary of the following content:\n\n{content}\n\nSummary:"
     summary = llm.predict(summary_prompt)
     return summary.strip()
 
-def format_search_results(results):
+def generate_overall_summary(results):
+    if not results:
+        return "No information available to summarize."
+    
+    combined_content = " ".join([result.get('content', '') for result in results[:NUM_SOURCES]])
+    summary_prompt = f"Provide a concise overall summary of the following information:\n\n{combined_content}\n\nSummary:"
+    summary = llm.predict(summary_prompt)
+    return summary
+
+def parse_json_response(text):
+    """Parse a JSON object or array out of an LLM reply, tolerating markdown code fences."""
+    text = text.strip()
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*```$", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    return json.loads(text)
+
+@st.cache_resource
+def get_summary_store():
+    """Process-wide summary cache shared by every session, keyed by source URL and content hash."""
+    return {"lock": threading.Lock(), "summaries": {}}
+
+def source_key(result):
+    content = result.get('content', '')
+    return hashlib.sha256(f"{result.get('url', '')}\x00{content}".encode("utf-8")).hexdigest()
+
+def summarize_all_in_one_request(results, missing):
+    """One structured-output call for the missing per-source summaries and the overall summary."""
+    sources = "\n\n".join(
+        f"Source {i}:\n{results[i].get('content', '')}" for i in missing
+    )
+    combined_content = " ".join([result.get('content', '') for result in results])
+    prompt = f"""Summarize search results.
+
+For each numbered source below, write a three-line summary of that source.
+Then write a concise overall summary of all of the information.
+
+Respond with only a JSON object of the form
+{{"summaries": {{"<source number>": "<three-line summary>", ...}}, "overall": "<overall summary>"}}
+
+{sources}
+
+All information:
+{combined_content}
+"""
+    data = parse_json_response(llm.predict(prompt))
+    summaries = {int(i): str(data["summaries"][str(i)]).strip() for i in missing}
+    return summaries, str(data["overall"]).strip()
+
+def summarize_search_results(results):
+    """Per-source three-line summaries and an overall summary, reusing cached summaries.
+
+    Everything missing from the cache is requested in a single structured
+    call; if that reply cannot be parsed, the summaries are generated
+    concurrently on a bounded thread pool instead.
+    """
+    results = results[:NUM_SOURCES]
+    if not results:
+        return [], "No information available to summarize."
+
+    store = get_summary_store()
+    keys = [source_key(result) for result in results]
+    overall_key = "overall:" + hashlib.sha256("".join(keys).encode("utf-8")).hexdigest()
+    with store["lock"]:
+        summaries = [store["summaries"].get(key) for key in keys]
+        overall_summary = store["summaries"].get(overall_key)
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+
+    if missing or overall_summary is None:
+        try:
+            new_summaries, overall_summary = summarize_all_in_one_request(results, missing)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            with ThreadPoolExecutor(max_workers=SUMMARY_WORKERS) as executor:
+                futures = {i: executor.submit(generate_three_line_summary, results[i].get('content', '')) for i in missing}
+                overall_future = executor.submit(generate_overall_summary, results)
+                new_summaries = {i: future.result() for i, future in futures.items()}
+                overall_summary = overall_future.result()
+        with store["lock"]:
+            for i, summary in new_summaries.items():
+                summaries[i] = summary
+                store["summaries"][keys[i]] = summary
+            store["summaries"][overall_key] = overall_summary
+            # Dicts keep insertion order, so the oldest summaries go first
+            while len(store["summaries"]) > SUMMARY_CACHE_SIZE:
+                del store["summaries"][next(iter(store["summaries"]))]
+
+    return summaries, overall_summary
+
+def format_search_results(results, summaries):
     if not results:
         return "No search results found."
     
-    formatted_results = "Top 5 Sources:\n\n"
-    for i, result in enumerate(results[:5], 1):
+    formatted_results = f"Top {NUM_SOURCES} Sources:\n\n"
+    for i, (result, summary) in enumerate(zip(results[:NUM_SOURCES], summaries), 1):
         title = result.get('title')
         url = result.get('url', 'No URL available')
-        content = result.get('content', 'No content available')
         
         if title:
             formatted_results += f"{i}. [{title}]({url})\n"
         else:
             formatted_results += f"{i}. [Reference {i}]({url})\n"
         
-        summary = generate_three_line_summary(content)
         formatted_results += f"   {summary}\n\n"
     
     return formatted_results
 
-def generate_overall_summary(results):
-    if not results:
-        return "No information available to summarize."
-    
-    combined_content = " ".join([result.get('content', '') for result in results[:5]])
-    summary_prompt = f"Provide a concise overall summary of the following information:\n\n{combined_content}\n\nSummary:"
-    summary = llm.predict(summary_prompt)
-    return summary
-
 def is_relevant_query(query, user_data):
+    department = user_data.get('department', '')
+    interests = user_data.get('interests', [])
+
+    # The local gate settles most queries; only borderline ones cost an LLM round trip
+    decision = get_relevance_gate(department, tuple(interests)).decide(query)
+    if decision is not None:
+        return decision
+
     prompt = f"""
-    Given the user's Godrej Company department: {user_data['department']}
-    and interests: {', '.join(user_data['interests'])},
+    Given the user's Godrej Company department: {department}
+    and interests: {', '.join(interests)},
     is the following query relevant? Query: {query}
     Respond with 'Yes' or 'No'.
     """
     response = llm.predict(prompt)
     return response.strip().lower() == 'yes'
 
+def parse_news_articles(text):
+    """Strictly parse the news digest JSON, keeping only well-formed articles."""
+    articles = parse_json_response(text)
+    if not isinstance(articles, list):
+        raise ValueError("News digest is not a JSON array")
+    return [
+        {key: str(article[key]) for key in NEWS_ARTICLE_KEYS}
+        for article in articles
+        if isinstance(article, dict) and all(key in article for key in NEWS_ARTICLE_KEYS)
+    ]
+
 def get_recent_news(user_data, num_articles=10):
     current_date = datetime.now(pytz.utc).strftime("%Y-%m-%d")
     
@@ -230,7 +394,7 @@ def get_recent_news(user_data, num_articles=10):
     4. The exact publication date and time (if available, in UTC)
     5. The source name
 
-    Format the output as a list of dictionaries, each containing 'title', 'summary', 'url', 'date', and 'source' keys.
+    Respond with only a JSON array of objects, each containing "title", "summary", "url", "date", and "source" keys.
     Ensure the 'date' field is in the format 'YYYY-MM-DD HH:MM:SS UTC' if available, or 'YYYY-MM-DD' if only the date is known.
     If the exact date is not available, use 'Recent' as the date value.
     
@@ -240,7 +404,7 @@ def get_recent_news(user_data, num_articles=10):
     {search_results}
     """
     
-    news_articles = eval(llm.predict(prompt))
+    news_articles = parse_news_articles(llm.predict(prompt))
     
     
     current_time = datetime.now(pytz.utc)
@@ -261,6 +425,18 @@ def get_recent_news(user_data, num_articles=10):
     return filtered_articles[:num_articles]
 
 
+@st.cache_resource
+def get_news_cache():
+    """Process-wide news digest, rebuilt on a schedule instead of once per user click."""
+    return RefreshingCache(
+        lambda: get_recent_news("Recent News Related to the NPCI"),
+        ttl=NEWS_TTL,
+        refresh_interval=NEWS_REFRESH_INTERVAL,
+        stale_while_revalidate=NEWS_STALE_WHILE_REVALIDATE,
+        name="news digest"
+    ).start()
+
+
 st.markdown('<p class="big-font">Advance AI Powered Search Engine 🤖</p>', unsafe_allow_html=True)
 
 if "user_logged_in" not in st.session_state:
@@ -294,7 +470,11 @@ if st.session_state.user_logged_in:
     with tab1:
 
         if "conversations" not in st.session_state:
-            st.session_state.conversations = {}
+            # Titles were computed when each conversation started; messages load on first open
+            st.session_state.conversations = {
+                conv_id: {"title": title, "messages": [], "loaded": False}
+                for conv_id, title in load_conversation_titles().items()
+            }
 
         if "current_conversation_id" not in st.session_state:
             st.session_state.current_conversation_id = None
@@ -314,15 +494,15 @@ if st.session_state.user_logged_in:
 
     
         for conv_id, conv_data in st.session_state.conversations.items():
-            if conv_data["messages"]:
-                conv_data["title"] = summarize_conversation(conv_data["messages"])
-            
             if st.sidebar.button(conv_data["title"], key=conv_id):
                 st.session_state.current_conversation_id = conv_id
 
 
         if st.session_state.current_conversation_id:
             conversation = st.session_state.conversations[st.session_state.current_conversation_id]
+            if not conversation.get("loaded", True):
+                conversation["messages"] = get_conversation_messages(st.session_state.current_conversation_id)
+                conversation["loaded"] = True
             
 
             for message in conversation["messages"]:
@@ -335,6 +515,7 @@ if st.session_state.user_logged_in:
 
                 if len(conversation["messages"]) == 1:
                     conversation["title"] = summarize_conversation(conversation["messages"])
+                    save_conversation_title(st.session_state.current_conversation_id, conversation["title"])
 
                 if is_relevant_query(prompt, st.session_state.user_data):
                     try:
@@ -347,8 +528,8 @@ if st.session_state.user_logged_in:
                             search_tool = TavilySearchResults(max_results=5)
                             search_results = search_tool.invoke(prompt)
                         
-                        formatted_results = format_search_results(search_results)
-                        overall_summary = generate_overall_summary(search_results)
+                        summaries, overall_summary = summarize_search_results(search_results)
+                        formatted_results = format_search_results(search_results, summaries)
                         
                         ai_response = f"{response['agent_outcome'].return_values['output']}\n\n{formatted_results}\nOverall Summary:\n{overall_summary}"
                     except Exception as e:
@@ -361,7 +542,7 @@ if st.session_state.user_logged_in:
                     st.markdown(ai_response)
     
                 conversation["messages"].append({"role": "assistant", "content": ai_response})
-                data_to_firebase(prompt, ai_response, conversation["title"])
+                data_to_firebase(prompt, ai_response, conversation["title"], st.session_state.current_conversation_id)
 
                 st.rerun()
         else:
@@ -370,25 +551,30 @@ if st.session_state.user_logged_in:
     with tab2:
             st.title("Latest News")
             
-            if "recent_news" not in st.session_state:
-                st.session_state.recent_news = []
+            news_cache = get_news_cache()
 
             if st.button("🔄 Refresh Latest News", key="refresh_news_button"):
                 with st.spinner("Fetching the latest news..."):
-                    st.session_state.recent_news = get_recent_news("Recent News Related to the NPCI")
-                st.success("News updated with the latest articles!")
+                    news_cache.refresh()
+                if news_cache.last_error:
+                    st.error(f"Could not refresh the news: {news_cache.last_error}")
+                else:
+                    st.success("News updated with the latest articles!")
 
+            recent_news = news_cache.get(block=False)
             col1, col2 = st.columns(2)
 
-            if st.session_state.recent_news:
-                for i, article in enumerate(st.session_state.recent_news):
+            if recent_news:
+                age = news_cache.age()
+                st.caption(f"Updated {int(age // 60)} minutes ago.")
+                for i, article in enumerate(recent_news):
                     with (col1 if i % 2 == 0 else col2).expander(f"📰 {article['title']}"):
                         st.markdown(f"**{article['summary']}**")
                         st.markdown(f"Source: {article['source']}")
                         st.markdown(f"Published: {article['date']}")
                         st.markdown(f"[Read Full Article]({article['url']})")
             else:
-                st.info("Click 'Refresh Latest News' to load the most recent articles.")
+                st.info("The news digest is being prepared. Check back shortly or click 'Refresh Latest News'.")
 
             st.caption("News articles are tailored to your interests and skills, focusing on the most recent publications. Click 'Refresh Latest News' for up-to-the-minute updates.")
 
@@ -0,0 +1,459 @@
+import os
+import sys
+import json
+import asyncio
+import time
+import zlib
+import tempfile
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_CORPUS = ["scraper/src/controller/rbi_circulars.json"]
+EMBEDDING_DIMENSION = 1536
+CANNED_ANSWER = "Based on the retrieved circulars, this is a canned benchmark answer."
+QUERY_WORDS = 12
+# Regression thresholds for --baseline runs
+MAX_P95_REGRESSION = 0.2
+P95_SLACK_MS = 1.0
+MAX_QUALITY_DROP = 0.01
+
+
+def fake_embedding(texts: List[str], dim: int = EMBEDDING_DIMENSION) -> np.ndarray:
+    """Deterministic signed hashed bag-of-words embeddings, L2-normalized.
+
+    Texts sharing words land near each other, so retrieval quality on the
+    fake vectors still tracks changes to chunking, fusion and ranking.
+    """
+    from lexical_index import tokenize
+
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in tokenize(text):
+            bucket = zlib.crc32(token.encode("utf-8"))
+            vectors[row, bucket % dim] += 1.0 if bucket & (1 << 31) else -1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class StubState:
+    """Shared state of the stub servers: the corpus matrix and injected latencies."""
+
+    def __init__(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict[str, Any]],
+                 embed_latency: float = 0.0, search_latency: float = 0.0, completion_latency: float = 0.0):
+        self.ids = ids
+        self.vectors = vectors
+        self.payloads = payloads
+        self.embed_latency = embed_latency
+        self.search_latency = search_latency
+        self.completion_latency = completion_latency
+
+
+def select_payload(payload: Dict[str, Any], with_payload: Any) -> Optional[Dict[str, Any]]:
+    """Apply a Qdrant with_payload selector (bool, field list or include/exclude dict)."""
+    if with_payload is None or with_payload is True:
+        return payload
+    if with_payload is False:
+        return None
+    if isinstance(with_payload, list):
+        return {key: payload[key] for key in with_payload if key in payload}
+    if isinstance(with_payload, dict) and "include" in with_payload:
+        return {key: payload[key] for key in with_payload["include"] if key in payload}
+    if isinstance(with_payload, dict) and "exclude" in with_payload:
+        return {key: value for key, value in payload.items() if key not in with_payload["exclude"]}
+    return payload
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI + Qdrant REST endpoints; filters are ignored by the search stub."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; Nagle plus delayed ACKs would add ~40ms to each
+    disable_nagle_algorithm = True
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body: Any, status: int = 200) -> None:
+        self.send_bytes(json.dumps(body).encode("utf-8"), "application/json", status)
+
+    def send_bytes(self, data: bytes, content_type: str, status: int = 200) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "":
+            self.send_json({"title": "qdrant - vector search engine", "version": "1.7.4"})
+        else:
+            self.send_json({"status": {"error": f"Not found: {self.path}"}}, 404)
+
+    def do_POST(self):
+        body = self.read_json()
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/embeddings"):
+            self.embeddings(body)
+        elif path.endswith("/chat/completions"):
+            self.completion(body)
+        elif path.endswith("/points/search/batch"):
+            time.sleep(self.state.search_latency)
+            self.send_json({"result": [self.search(request) for request in body["searches"]],
+                            "status": "ok", "time": 0.0})
+        elif path.endswith("/points/search"):
+            time.sleep(self.state.search_latency)
+            self.send_json({"result": self.search(body), "status": "ok", "time": 0.0})
+        else:
+            self.send_json({"status": {"error": f"Not found: {self.path}"}}, 404)
+
+    def embeddings(self, body: Dict[str, Any]) -> None:
+        time.sleep(self.state.embed_latency)
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        vectors = fake_embedding(texts)
+        tokens = sum(len(text.split()) for text in texts)
+        self.send_json({
+            "object": "list",
+            "model": body.get("model", "stub"),
+            "data": [{"object": "embedding", "index": i, "embedding": vector.tolist()}
+                     for i, vector in enumerate(vectors)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+    def completion(self, body: Dict[str, Any]) -> None:
+        time.sleep(self.state.completion_latency)
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(CANNED_ANSWER) // 4,
+                 "total_tokens": prompt_tokens + len(CANNED_ANSWER) // 4}
+        base = {"id": "chatcmpl-bench", "created": int(time.time()), "model": body.get("model", "stub")}
+        if not body.get("stream"):
+            self.send_json({**base, "object": "chat.completion", "usage": usage, "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": CANNED_ANSWER}
+            }]})
+            return
+        events = []
+        for word in CANNED_ANSWER.split(" "):
+            events.append({**base, "object": "chat.completion.chunk", "choices": [{
+                "index": 0, "finish_reason": None, "delta": {"content": word + " "}
+            }]})
+        events.append({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        data = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+        self.send_bytes(data.encode("utf-8"), "text/event-stream")
+
+    def search(self, request: Dict[str, Any]) -> List[Dict[str, Any]]:
+        vector = request["vector"]
+        if isinstance(vector, dict):
+            vector = vector["vector"]
+        from vector_store import top_k, normalize_rows
+
+        scores = self.state.vectors @ normalize_rows(np.asarray(vector, dtype=np.float32))
+        return [{
+            "id": self.state.ids[row],
+            "version": 0,
+            "score": float(scores[row]),
+            "payload": select_payload(self.state.payloads[row], request.get("with_payload")),
+            "vector": None
+        } for row in top_k(scores, int(request.get("limit", 10)))]
+
+
+def start_stub_server(state: StubState) -> ThreadingHTTPServer:
+    """Serve the stubs on an ephemeral localhost port in a daemon thread."""
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="bench-stub", daemon=True).start()
+    return server
+
+
+def load_corpus(paths: List[str]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Unique circulars from the inputs and their chunk records."""
+    from ingest import iter_circulars, build_chunk_records, circular_point_id
+
+    circulars, records, seen = [], [], set()
+    for circular in iter_circulars(paths):
+        parent_id = circular_point_id(circular)
+        if parent_id in seen:
+            continue
+        seen.add(parent_id)
+        circulars.append(circular)
+        records.extend(build_chunk_records(circular))
+    return circulars, records
+
+
+def labelled_queries(circulars: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Two queries per circular, each labelled with that circular's id: its subject and its opening words."""
+    from ingest import circular_point_id
+    from chunking import section_texts
+
+    queries = []
+    for circular in circulars:
+        expected = circular_point_id(circular)
+        queries.append({"query": circular["Subject"], "expected": expected, "kind": "subject"})
+        body = " ".join(section_texts(circular)).replace("Section:", " ").split()
+        if len(body) >= QUERY_WORDS:
+            queries.append({"query": " ".join(body[:QUERY_WORDS]), "expected": expected, "kind": "passage"})
+    return queries
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 and mean of latency samples in seconds, reported in milliseconds."""
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(samples), "mean_ms": round(float(values.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+
+def retrieval_quality(ranked_ids: List[List[str]], expected: List[str], k: int) -> Dict[str, float]:
+    """recall@k (one relevant circular per query) and MRR over the returned ranking."""
+    hits, reciprocal_ranks = 0, []
+    for ids, target in zip(ranked_ids, expected):
+        rank = ids.index(target) + 1 if target in ids else None
+        hits += rank is not None and rank <= k
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    return {f"recall@{k}": round(hits / len(expected), 4), "mrr": round(float(np.mean(reciprocal_ranks)), 4)}
+
+
+class StageRecorder:
+    """Collects raw span durations per stage while a workload runs."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.active = False
+        self._lock = threading.Lock()
+
+    def __call__(self, stage: str, seconds: float, attrs: Dict[str, Any]) -> None:
+        if self.active:
+            with self._lock:
+                self.samples[stage].append(seconds)
+
+    def run(self, fn, items: List[Any], concurrency: int) -> Tuple[List[Any], Dict[str, Any]]:
+        """Call fn on every item and report throughput, end-to-end and per-stage latency."""
+        self.samples.clear()
+        latencies = []
+
+        def timed(item):
+            start = time.perf_counter()
+            result = fn(item)
+            latencies.append(time.perf_counter() - start)
+            return result
+
+        self.active = True
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(timed, items))
+        elapsed = time.perf_counter() - start
+        self.active = False
+        return results, {
+            "requests": len(items),
+            "throughput_qps": round(len(items) / elapsed, 2) if elapsed else None,
+            "latency": percentiles(latencies),
+            "stages": {stage: percentiles(samples) for stage, samples in sorted(self.samples.items())}
+        }
+
+    def run_batch(self, fn, items: List[Any]) -> Dict[str, Any]:
+        """Drain the async generator fn(items); a result's latency is its arrival time since the start."""
+        self.samples.clear()
+        latencies = []
+
+        async def consume():
+            async for _ in fn(items):
+                latencies.append(time.perf_counter() - start)
+
+        self.active = True
+        start = time.perf_counter()
+        asyncio.run(consume())
+        elapsed = time.perf_counter() - start
+        self.active = False
+        return {
+            "requests": len(items),
+            "throughput_qps": round(len(items) / elapsed, 2) if elapsed else None,
+            "latency": percentiles(latencies),
+            "stages": {stage: percentiles(samples) for stage, samples in sorted(self.samples.items())}
+        }
+
+
+def configure_environment(args, base_url: str, workdir: str) -> None:
+    """Point the app at the stubs and at throwaway caches.
+
+    Modules read their configuration at import, so this must run before
+    any of them (ingest and retrieval included) is imported.
+    """
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "QDRANT_URL": base_url,
+        "QDRANT_API_KEY": "",
+        "QDRANT_PREFER_GRPC": "false",
+        "RETRIEVAL_BACKEND": args.backend,
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite3"),
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "HYBRID_SEARCH": "true" if args.hybrid else "false",
+        "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical_index"),
+        "LOCAL_INDEX_PATH": os.path.join(workdir, "local_index"),
+        "VECTOR_QUANTIZATION": args.quantization,
+        "CORPUS_STORE_PATH": os.path.join(workdir, "corpus_store"),
+    })
+
+
+def build_indexes(args, circulars: List[Dict[str, Any]], records: List[Dict[str, Any]], vectors: np.ndarray) -> None:
+    """Build the local vector index (with quantized codes), lexical index and corpus store the options need."""
+    if args.backend == "local":
+        from vector_store import LocalIndexWriter
+
+        writer = LocalIndexWriter(os.environ["LOCAL_INDEX_PATH"], vectors.shape[1])
+        writer.add([record["id"] for record in records], vectors, [record["payload"] for record in records])
+        writer.close()
+        if args.quantization != "none":
+            from vector_store import build_quantized
+
+            build_quantized(os.environ["LOCAL_INDEX_PATH"], args.quantization)
+    if args.hybrid:
+        from ingest import build_lexical_index
+
+        build_lexical_index(circulars).save(os.environ["LEXICAL_INDEX_PATH"])
+    if args.corpus_store:
+        from ingest import build_corpus_store
+
+        build_corpus_store(circulars, os.environ["CORPUS_STORE_PATH"])
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_p95_regression: float = MAX_P95_REGRESSION,
+            p95_slack_ms: float = P95_SLACK_MS, max_quality_drop: float = MAX_QUALITY_DROP) -> List[str]:
+    """Print latency and quality deltas against a previous run and return the regressions past the thresholds.
+
+    p95 regresses when it grows by more than max_p95_regression (a fraction)
+    and by more than p95_slack_ms, so sub-millisecond jitter never fails a
+    run; a quality metric regresses when it drops by more than max_quality_drop.
+    """
+    regressions = []
+    print(f"\nChange vs baseline ({baseline['config'].get('timestamp', '?')}):")
+    for workload in ("search", "rag", "batch"):
+        current, previous = results.get(workload), baseline.get(workload)
+        if not current or not previous:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            before, after = previous["latency"].get(key), current["latency"].get(key)
+            if before:
+                print(f"  {workload:6} {key:7} {before:9.2f} -> {after:9.2f} ({(after - before) / before:+.1%})")
+                if (key == "p95_ms" and after > before * (1 + max_p95_regression)
+                        and after - before > p95_slack_ms):
+                    regressions.append(f"{workload} p95 {before:.2f}ms -> {after:.2f}ms")
+    for key, after in results["quality"].items():
+        before = baseline.get("quality", {}).get(key)
+        if before is not None:
+            print(f"  quality {key:9} {before:.4f} -> {after:.4f}")
+            if after < before - max_quality_drop:
+                regressions.append(f"quality {key} {before:.4f} -> {after:.4f}")
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Replay labelled queries through the RAG pipeline against local OpenAI/Qdrant stubs."
+    )
+    parser.add_argument("--corpus", nargs="+", default=DEFAULT_CORPUS, help="Scraper output files to index")
+    parser.add_argument("--backend", choices=("qdrant", "local"), default="qdrant")
+    parser.add_argument("--hybrid", action="store_true", help="Build a lexical index and fuse BM25 hits")
+    parser.add_argument("--quantization", choices=("none", "int8", "binary"), default="none",
+                        help="Search quantized codes of the local index and rescore (local backend only)")
+    parser.add_argument("--answer-cache", action="store_true", help="Leave the semantic answer cache on")
+    parser.add_argument("--corpus-store", action="store_true",
+                        help="Fetch ids and content hashes from the Qdrant stub and read payloads from a corpus store")
+    parser.add_argument("--mode", choices=("search", "rag", "both", "batch"), default="both")
+    parser.add_argument("-k", type=int, default=5, help="Circulars retrieved per query")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the query set")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Worker threads, or in batch mode the completions in flight")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Injected stub embedding latency")
+    parser.add_argument("--search-latency-ms", type=float, default=0.0, help="Injected stub Qdrant latency")
+    parser.add_argument("--completion-latency-ms", type=float, default=0.0, help="Injected stub LLM latency")
+    parser.add_argument("--out", default=".cache/benchmark.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--max-p95-regression", type=float, default=MAX_P95_REGRESSION,
+                        help="Fail when a p95 latency grows by more than this fraction of the baseline")
+    parser.add_argument("--p95-slack-ms", type=float, default=P95_SLACK_MS,
+                        help="p95 growth below this many milliseconds never fails")
+    parser.add_argument("--max-quality-drop", type=float, default=MAX_QUALITY_DROP,
+                        help="Fail when recall@k or MRR drops by more than this")
+    args = parser.parse_args(argv)
+
+    state = StubState([], np.zeros((0, EMBEDDING_DIMENSION), dtype=np.float32), [],
+                      args.embed_latency_ms / 1000, args.search_latency_ms / 1000, args.completion_latency_ms / 1000)
+    server = start_stub_server(state)
+    configure_environment(args, f"http://127.0.0.1:{server.server_address[1]}", tempfile.mkdtemp(prefix="rag-bench-"))
+
+    circulars, records = load_corpus(args.corpus)
+    queries = labelled_queries(circulars)
+    state.ids = [record["id"] for record in records]
+    state.vectors = fake_embedding([record["text"] for record in records])
+    state.payloads = [record["payload"] for record in records]
+    build_indexes(args, circulars, records, state.vectors)
+    print(f"Indexed {len(circulars)} circulars as {len(records)} chunks; {len(queries)} labelled queries")
+
+    import gradio_app
+    from metrics import add_span_listener
+
+    recorder = StageRecorder()
+    add_span_listener(recorder)
+    workload = [q for _ in range(args.repeat) for q in queries]
+    results = {"config": {**vars(args), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                          "circulars": len(circulars), "chunks": len(records), "queries": len(queries)}}
+
+    if args.mode in ("search", "both"):
+        # The first pass runs with a cold embedding cache; its rankings give the quality numbers
+        docs, results["search"] = recorder.run(
+            lambda q: gradio_app.search_circulars(q["query"], limit=args.k), workload, args.concurrency)
+    else:
+        docs = [gradio_app.search_circulars(q["query"], limit=args.k) for q in queries]
+    results["quality"] = retrieval_quality([[doc["id"] for doc in found] for found in docs[:len(queries)]],
+                                           [q["expected"] for q in queries], args.k)
+    if args.mode in ("rag", "both"):
+        _, results["rag"] = recorder.run(
+            lambda q: gradio_app.rag_query(q["query"], num_results=args.k), workload, args.concurrency)
+    if args.mode == "batch":
+        results["batch"] = recorder.run_batch(
+            lambda items: gradio_app.rag_query_batch([q["query"] for q in items], args.k,
+                                                     concurrency=args.concurrency), workload)
+    server.shutdown()
+
+    for name in ("search", "rag", "batch"):
+        if name in results:
+            latency = results[name]["latency"]
+            print(f"{name:6} {results[name]['throughput_qps']:8.1f} q/s  p50 {latency['p50_ms']:.2f}ms  "
+                  f"p95 {latency['p95_ms']:.2f}ms  p99 {latency['p99_ms']:.2f}ms")
+            for stage, stats in results[name]["stages"].items():
+                print(f"  {stage:15} p50 {stats['p50_ms']:.2f}ms  p95 {stats['p95_ms']:.2f}ms  n={stats['count']}")
+    print("quality " + "  ".join(f"{key} {value:.4f}" for key, value in results["quality"].items()))
+
+    if os.path.dirname(args.out):
+        os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_p95_regression, args.p95_slack_ms,
+                                  args.max_quality_drop)
+        if regressions:
+            print("\nRegressed past the thresholds:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
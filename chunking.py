@@ -0,0 +1,113 @@
+import os
+import re
+from typing import List, Dict, Any
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to whitespace tokens when tiktoken is not installed
+    tiktoken = None
+    # Words undercount BPE tokens, so every token budget and chunk size runs over
+    print("tiktoken is not installed; token counts fall back to whitespace words and undercount real tokens")
+
+# Configuration
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "60"))
+TOKENIZER_ENCODING = os.environ.get("TOKENIZER_ENCODING", "cl100k_base")
+
+_WORD_PATTERN = re.compile(r"\S+\s*")
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    return _encoding
+
+
+def tokenize(text: str) -> List[Any]:
+    """Split text into tokens (tiktoken ids, or whitespace-delimited words as a fallback)."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.encode(text)
+    return _WORD_PATTERN.findall(text)
+
+
+def detokenize(tokens: List[Any]) -> str:
+    """Inverse of tokenize."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(tokens)
+    return "".join(tokens)
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text locally, without an API call."""
+    return len(tokenize(text))
+
+
+def token_windows(text: str, size: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split text into windows of at most size tokens that overlap by overlap tokens."""
+    tokens = tokenize(text)
+    if len(tokens) <= size:
+        return [text]
+    step = max(1, size - overlap)
+    windows = []
+    for start in range(0, len(tokens), step):
+        windows.append(detokenize(tokens[start:start + size]))
+        if start + size >= len(tokens):
+            break
+    return windows
+
+
+def build_header(circular: Dict[str, Any]) -> str:
+    """Metadata header that is prepended to every chunk before embedding."""
+    header = f"Title: {circular['Subject']}\n"
+    header += f"Department: {circular['Department']}\n"
+    header += f"Circular Number: {circular['Circular Number']}\n"
+    header += f"Date: {circular['Date Of Issue']}\n"
+    header += f"Meant For: {circular['Meant For']}\n\n"
+    return header
+
+
+def section_texts(circular: Dict[str, Any]) -> List[str]:
+    """The circular's contentSections rendered as one string each."""
+    texts = []
+    circular_details = circular.get("details", {}).get("circular", {})
+    for section in circular_details.get("contentSections", []):
+        text = ""
+        if section.get("title"):
+            text += f"Section: {section['title']}\n"
+        if section.get("content"):
+            text += f"{section['content']}\n\n"
+        if text:
+            texts.append(text)
+    return texts
+
+
+def chunk_circular(circular: Dict[str, Any], size: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split a circular's body into section-aligned chunks of at most size tokens.
+
+    Consecutive short sections are packed together; sections longer than
+    size are cut into overlapping token windows.
+    """
+    chunks = []
+    current = ""
+    current_tokens = 0
+    for text in section_texts(circular):
+        text_tokens = count_tokens(text)
+        if text_tokens > size:
+            if current:
+                chunks.append(current)
+                current, current_tokens = "", 0
+            chunks.extend(token_windows(text, size, overlap))
+            continue
+        if current and current_tokens + text_tokens > size:
+            chunks.append(current)
+            current, current_tokens = "", 0
+        current += text
+        current_tokens += text_tokens
+    if current:
+        chunks.append(current)
+    # Circulars scraped without any content still get a single, header-only chunk
+    return chunks or [""]
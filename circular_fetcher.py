@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:  # Fall back to the pure-Python parser when lxml is not installed
+    HTML_PARSER = "html.parser"
+    print("lxml is not installed; circular pages are parsed with the slower html.parser")
+
+# Configuration
+FETCH_CACHE_DIR = os.environ.get("FETCH_CACHE_DIR", ".cache/circulars")
+FETCH_CONNECT_TIMEOUT = float(os.environ.get("FETCH_CONNECT_TIMEOUT", "5"))
+FETCH_READ_TIMEOUT = float(os.environ.get("FETCH_READ_TIMEOUT", "15"))
+FETCH_POOL_SIZE = int(os.environ.get("FETCH_POOL_SIZE", "16"))
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", "8"))
+# Published circulars rarely change; within this age a cached copy is used without revalidating
+FETCH_MAX_AGE = float(os.environ.get("FETCH_MAX_AGE", str(24 * 3600)))
+
+USER_AGENT = "rbi-circulars-rag/1.0"
+# Only the circular body is parsed; the rest of the page is skipped by the tokenizer
+CONTENT_STRAINER = SoupStrainer("div", class_="content")
+
+
+def extract_text(html: bytes) -> str:
+    """Text of the page's circular body, one block per line, or "" when there is none."""
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=CONTENT_STRAINER)
+    content_div = soup.find("div", class_="content")
+    if content_div is None:
+        return ""
+    return content_div.get_text("\n", strip=True)
+
+
+class CircularFetcher:
+    """Fetches circular pages over a pooled session, caching extracted text on disk.
+
+    A cached page younger than max_age is served without a request. Older
+    ones are revalidated with If-None-Match / If-Modified-Since, so an
+    unchanged page costs a 304 and no parsing. If the site is unreachable,
+    a stale cached copy is served rather than failing.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = FETCH_CACHE_DIR, max_age: float = FETCH_MAX_AGE,
+                 pool_size: int = FETCH_POOL_SIZE, workers: int = FETCH_WORKERS):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.workers = workers
+        self.timeout = (FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                              allowed_methods=("GET",))
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def _read(self, url: str) -> Optional[Dict[str, str]]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, url: str, entry: Dict[str, str]) -> None:
+        if not self.cache_dir:
+            return
+        # Write-then-rename so concurrent readers never see a partial entry
+        path = self._path(url)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def fetch(self, url: str) -> str:
+        """Extracted text of the circular at url."""
+        entry = self._read(url)
+        if entry is not None and time.time() - entry["fetched_at"] < self.max_age:
+            self._count("hits")
+            return entry["text"]
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and entry is not None:
+                self._count("revalidated")
+                entry["fetched_at"] = time.time()
+                self._write(url, entry)
+                return entry["text"]
+            response.raise_for_status()
+        except requests.RequestException as e:
+            if entry is None:
+                raise
+            print(f"Serving stale copy of {url}: {str(e)}")
+            return entry["text"]
+
+        self._count("misses")
+        text = extract_text(response.content)
+        self._write(url, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+            "text": text
+        })
+        return text
+
+    def fetch_many(self, urls: List[str]) -> Dict[str, Optional[str]]:
+        """Fetch several circulars concurrently; a failed fetch maps to None."""
+        unique_urls = list(dict.fromkeys(urls))
+
+        def fetch_or_none(url: str) -> Optional[str]:
+            try:
+                return self.fetch(url)
+            except Exception as e:
+                print(f"Error fetching {url}: {str(e)}")
+                return None
+
+        if len(unique_urls) <= 1:
+            return {url: fetch_or_none(url) for url in unique_urls}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(unique_urls))) as pool:
+            return dict(zip(unique_urls, pool.map(fetch_or_none, unique_urls)))
+
+    def stats(self) -> Dict[str, int]:
+        """Cache hit / revalidation / miss counters for this process."""
+        with self._lock:
+            return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses}
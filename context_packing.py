@@ -0,0 +1,97 @@
+import os
+import re
+from typing import List, Dict, Any, Set, Tuple
+
+from chunking import count_tokens, tokenize, detokenize
+
+# Configuration
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_DEDUP_THRESHOLD = float(os.environ.get("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+MIN_PASSAGE_TOKENS = int(os.environ.get("MIN_PASSAGE_TOKENS", "40"))
+
+SHINGLE_WORDS = 5
+PASSAGE_SEPARATOR = "\n...\n"
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text: str) -> Set[Tuple[str, ...]]:
+    """The overlapping SHINGLE_WORDS-word runs in text, for near-duplicate detection."""
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {tuple(words)} if words else set()
+    return set(zip(*(words[i:] for i in range(SHINGLE_WORDS))))
+
+
+def document_header(number: int, doc: Dict[str, Any]) -> str:
+    header = f"Document {number}:\n"
+    header += f"Title: {doc['title']}\n"
+    header += f"Circular Number: {doc['circular_number']}\n"
+    header += f"Department: {doc['department']}\n"
+    header += f"Date: {doc['date']}\n"
+    header += "Relevant Passages: "
+    return header
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    return detokenize(tokenize(text)[:max_tokens]).rstrip() + " ..."
+
+
+def pack_context(docs: List[Dict[str, Any]], budget: int) -> Tuple[str, Dict[str, int]]:
+    """Fill a token budget with the best-scoring distinct passages of the retrieved circulars.
+
+    Passages are taken best score first. One whose word shingles are mostly
+    (CONTEXT_DEDUP_THRESHOLD) already in the context is dropped, which
+    removes duplicates and the overlap between adjacent chunks. Each
+    circular's header is charged against the budget with its first passage,
+    and the passage that crosses the budget is truncated rather than dropped.
+    The packed passages are rendered grouped by circular in retrieval order.
+    """
+    candidates = []
+    for doc_index, doc in enumerate(docs):
+        for passage in doc.get("passages", []):
+            if passage["text"].strip():
+                candidates.append((passage["score"], doc_index, passage))
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1], candidate[2]["chunk_index"]))
+
+    separator_tokens = count_tokens(PASSAGE_SEPARATOR)
+    seen_shingles = set()
+    selected = {}  # doc index -> [(chunk index, text)]
+    used_tokens = 0
+    duplicates = 0
+    truncated = 0
+    for _, doc_index, passage in candidates:
+        text = passage["text"]
+        passage_shingles = shingles(text)
+        overlap = len(passage_shingles & seen_shingles)
+        if passage_shingles and overlap >= CONTEXT_DEDUP_THRESHOLD * len(passage_shingles):
+            duplicates += 1
+            continue
+        text_tokens = count_tokens(text)
+        cost = text_tokens + separator_tokens
+        if doc_index not in selected:
+            cost += count_tokens(document_header(len(selected) + 1, docs[doc_index]))
+        remaining = budget - used_tokens
+        if cost > remaining:
+            room = remaining - (cost - text_tokens)
+            if room < MIN_PASSAGE_TOKENS:
+                continue
+            text = truncate_tokens(text, room)
+            cost = remaining
+            truncated += 1
+        seen_shingles |= passage_shingles
+        selected.setdefault(doc_index, []).append((passage["chunk_index"], text))
+        used_tokens += cost
+
+    context = ""
+    for number, doc_index in enumerate(sorted(selected), start=1):
+        passages = PASSAGE_SEPARATOR.join(text for _, text in sorted(selected[doc_index]))
+        context += document_header(number, docs[doc_index]) + passages + "\n\n"
+    stats = {
+        "passages_in": len(candidates),
+        "passages_used": sum(len(passages) for passages in selected.values()),
+        "duplicates_dropped": duplicates,
+        "truncated": truncated,
+        "documents_used": len(selected),
+        "context_tokens": count_tokens(context),
+    }
+    return context, stats
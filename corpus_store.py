@@ -0,0 +1,259 @@
+import os
+import json
+import shutil
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+import numpy as np
+
+from chunking import build_header
+
+# Configuration
+CORPUS_STORE_PATH = os.environ.get("CORPUS_STORE_PATH", ".cache/corpus_store")
+
+META_FILE = "meta.json"
+CHUNK_IDS_FILE = "chunk_ids.npy"
+CHUNK_PARENTS_FILE = "chunk_parents.npy"
+CIRCULAR_IDS_FILE = "circular_ids.npy"
+FIRST_CHUNKS_FILE = "circular_first_chunk.npy"
+DATE_VALUES_FILE = "circular_date_value.npy"
+CHUNK_TEXT_COLUMN = "chunk_text"
+# Per-circular string columns; chunks point at their circular's row instead of repeating them
+CIRCULAR_COLUMNS = ("title", "department", "circular_number", "date", "meant_for", "link", "content_hash")
+# Point ids are UUID strings
+ID_DTYPE = "S36"
+
+
+class StringColumnWriter:
+    """Appends UTF-8 strings to a blob file, recording where each one ends."""
+
+    def __init__(self, directory: str, name: str):
+        self.directory = directory
+        self.name = name
+        self.offsets = [0]
+        self._blob = open(os.path.join(directory, f"{name}.bin"), "wb")
+
+    def append(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self._blob.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self) -> None:
+        self._blob.close()
+        np.save(os.path.join(self.directory, f"{self.name}.offsets.npy"), np.asarray(self.offsets, dtype=np.int64))
+
+
+class StringColumn:
+    """Variable-length strings read straight out of a memory-mapped blob via an offsets array."""
+
+    def __init__(self, directory: str, name: str):
+        self.offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode="r")
+        if self.offsets[-1]:
+            self.blob = np.memmap(os.path.join(directory, f"{name}.bin"), dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.empty(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def raw(self, row: int) -> memoryview:
+        """The UTF-8 bytes of one string, as a view into the mapped file."""
+        return memoryview(self.blob[self.offsets[row]:self.offsets[row + 1]])
+
+    def __getitem__(self, row: int) -> str:
+        return str(self.raw(row), "utf-8")
+
+
+class CorpusWriter:
+    """Streams chunk records, one circular at a time, into the layout CorpusStore memory-maps.
+
+    The store is built in a sibling directory and swapped in by close(), so
+    a running app that has the old files mapped never sees them rewritten.
+    """
+
+    def __init__(self, directory: str):
+        self.target = directory.rstrip("/\\") or directory
+        directory = f"{self.target}.building"
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+        self.directory = directory
+        self.chunk_ids = []
+        self.chunk_parents = []
+        self.circular_ids = []
+        self.first_chunks = [0]
+        self.date_values = []
+        self.chunk_texts = StringColumnWriter(directory, CHUNK_TEXT_COLUMN)
+        self.columns = {name: StringColumnWriter(directory, name) for name in CIRCULAR_COLUMNS}
+        self._seen = set()
+
+    def add(self, records: List[Dict[str, Any]]) -> bool:
+        """Append the chunk records of one circular (as built by ingest.build_chunk_records).
+
+        Returns False, writing nothing, for a circular that is already stored.
+        """
+        payload = records[0]["payload"]
+        if payload["parent_id"] in self._seen:
+            return False
+        self._seen.add(payload["parent_id"])
+        circular_row = len(self.circular_ids)
+        self.circular_ids.append(payload["parent_id"])
+        self.date_values.append(payload.get("date_value") or 0)
+        for name, column in self.columns.items():
+            column.append(str(payload.get(name, "")))
+        for record in records:
+            self.chunk_ids.append(record["id"])
+            self.chunk_parents.append(circular_row)
+            self.chunk_texts.append(record["payload"]["text"])
+        self.first_chunks.append(len(self.chunk_ids))
+        return True
+
+    def close(self) -> None:
+        """Write the id and offset arrays and the metadata that makes the store loadable."""
+        self.chunk_texts.close()
+        for column in self.columns.values():
+            column.close()
+        np.save(os.path.join(self.directory, CHUNK_IDS_FILE), np.asarray(self.chunk_ids, dtype=ID_DTYPE))
+        np.save(os.path.join(self.directory, CHUNK_PARENTS_FILE), np.asarray(self.chunk_parents, dtype=np.int32))
+        np.save(os.path.join(self.directory, CIRCULAR_IDS_FILE), np.asarray(self.circular_ids, dtype=ID_DTYPE))
+        np.save(os.path.join(self.directory, FIRST_CHUNKS_FILE), np.asarray(self.first_chunks, dtype=np.int64))
+        np.save(os.path.join(self.directory, DATE_VALUES_FILE), np.asarray(self.date_values, dtype=np.int64))
+        with open(os.path.join(self.directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"circulars": len(self.circular_ids), "chunks": len(self.chunk_ids)}, f)
+        # A directory cannot be replaced while it has entries, so move the old one aside first.
+        # Its files are only unlinked, and existing memory maps of them stay valid.
+        retired = f"{self.target}.old"
+        if os.path.exists(retired):
+            shutil.rmtree(retired)
+        if os.path.exists(self.target):
+            os.replace(self.target, retired)
+        os.replace(self.directory, self.target)
+        shutil.rmtree(retired, ignore_errors=True)
+        self.directory = self.target
+
+
+def store_signature(directory: str) -> Tuple[int, int]:
+    """Identifies one build of the store in directory; a rebuild swaps in a new meta file."""
+    stat = os.stat(os.path.join(directory, META_FILE))
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class CorpusStore:
+    """Read-only columnar view of the chunked corpus, memory-mapped from a CorpusWriter directory.
+
+    Chunk texts and circular metadata stay in the mapped files; a payload
+    is only assembled for the rows that are asked for. Lookups by point id
+    or circular id go through dicts built on first use.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.signature = store_signature(directory)
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.chunk_ids = np.load(os.path.join(directory, CHUNK_IDS_FILE), mmap_mode="r")
+        self.chunk_parents = np.load(os.path.join(directory, CHUNK_PARENTS_FILE), mmap_mode="r")
+        self.circular_ids = np.load(os.path.join(directory, CIRCULAR_IDS_FILE), mmap_mode="r")
+        self.first_chunks = np.load(os.path.join(directory, FIRST_CHUNKS_FILE), mmap_mode="r")
+        self.date_values = np.load(os.path.join(directory, DATE_VALUES_FILE), mmap_mode="r")
+        self.chunk_texts = StringColumn(directory, CHUNK_TEXT_COLUMN)
+        self.columns = {name: StringColumn(directory, name) for name in CIRCULAR_COLUMNS}
+        self._chunk_rows = None
+        self._circular_rows = None
+
+    @classmethod
+    def load(cls, directory: str = CORPUS_STORE_PATH) -> "CorpusStore":
+        return cls(directory)
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def latest(self) -> "CorpusStore":
+        """This store, or the rebuilt one if ingest has swapped a new build into its directory since."""
+        try:
+            if store_signature(self.directory) == self.signature:
+                return self
+            return CorpusStore(self.directory)
+        except (OSError, ValueError):
+            # Caught mid-swap; keep serving the old mapping until the next call
+            return self
+
+    def chunk_row(self, point_id: Any) -> Optional[int]:
+        """Row of a chunk by its point id, or None if the store does not hold it."""
+        if self._chunk_rows is None:
+            self._chunk_rows = {value.decode("ascii"): row for row, value in enumerate(self.chunk_ids)}
+        return self._chunk_rows.get(str(point_id))
+
+    def circular_row(self, parent_id: str) -> Optional[int]:
+        """Row of a circular by its id, or None if the store does not hold it."""
+        if self._circular_rows is None:
+            self._circular_rows = {value.decode("ascii"): row for row, value in enumerate(self.circular_ids)}
+        return self._circular_rows.get(parent_id)
+
+    def circular_metadata(self, circular_row: int) -> Dict[str, Any]:
+        """The circular-level payload fields of one circular."""
+        metadata = {name: column[circular_row] for name, column in self.columns.items()}
+        metadata["parent_id"] = self.circular_ids[circular_row].decode("ascii")
+        metadata["date_value"] = int(self.date_values[circular_row]) or None
+        metadata["chunk_count"] = int(self.first_chunks[circular_row + 1] - self.first_chunks[circular_row])
+        return metadata
+
+    def chunk_payload(self, row: int) -> Dict[str, Any]:
+        """The payload ingest would store for the chunk at row."""
+        circular_row = int(self.chunk_parents[row])
+        payload = self.circular_metadata(circular_row)
+        payload["chunk_index"] = row - int(self.first_chunks[circular_row])
+        payload["text"] = self.chunk_texts[row]
+        return payload
+
+    def payload(self, point_id: Any) -> Optional[Dict[str, Any]]:
+        """The payload of a chunk by point id, or None if the store does not hold it."""
+        row = self.chunk_row(point_id)
+        return None if row is None else self.chunk_payload(row)
+
+    def circular(self, parent_id: str) -> Optional[Dict[str, Any]]:
+        """A circular's metadata with the texts of all its chunks, or None if the store does not hold it."""
+        circular_row = self.circular_row(parent_id)
+        if circular_row is None:
+            return None
+        circular = self.circular_metadata(circular_row)
+        rows = range(int(self.first_chunks[circular_row]), int(self.first_chunks[circular_row + 1]))
+        circular["chunks"] = [self.chunk_texts[row] for row in rows]
+        return circular
+
+    def iter_circulars(self) -> Iterator[Dict[str, Any]]:
+        """Stream parent records in the shape Ingestor.prepare yields, one circular at a time.
+
+        Chunk texts come from the store, so nothing is re-parsed or re-chunked.
+        """
+        for circular_row in range(len(self.circular_ids)):
+            metadata = self.circular_metadata(circular_row)
+            header = build_header({
+                "Subject": metadata["title"],
+                "Department": metadata["department"],
+                "Circular Number": metadata["circular_number"],
+                "Date Of Issue": metadata["date"],
+                "Meant For": metadata["meant_for"]
+            })
+            chunks = []
+            first_chunk = int(self.first_chunks[circular_row])
+            for row in range(first_chunk, int(self.first_chunks[circular_row + 1])):
+                text = self.chunk_texts[row]
+                chunks.append({
+                    "id": self.chunk_ids[row].decode("ascii"),
+                    # A header-only chunk already stores the header as its text
+                    "text": text if text == header else header + text,
+                    "payload": {**metadata, "chunk_index": row - first_chunk, "text": text}
+                })
+            yield {"id": metadata["parent_id"], "content_hash": metadata["content_hash"], "chunks": chunks}
+
+    def iter_chunk_records(self) -> Iterator[Dict[str, Any]]:
+        """Stream every chunk record (id, embedded text, payload) in store order."""
+        for circular in self.iter_circulars():
+            yield from circular["chunks"]
+
+
+def load_corpus_store(directory: str = CORPUS_STORE_PATH) -> Optional[CorpusStore]:
+    """The corpus store in directory, or None when none has been built."""
+    if not os.path.exists(os.path.join(directory, META_FILE)):
+        return None
+    return CorpusStore.load(directory)
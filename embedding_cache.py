@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+# Configuration - the on-disk tier is shared by every worker on the host
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "2048"))
+
+
+def normalize_text(text: str) -> str:
+    """Normalize unicode and collapse whitespace so trivial variants share a key."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """Content-addressed key for an embedding of text under the given model."""
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache: an in-process LRU in front of a SQLite store."""
+
+    def __init__(self, path: Optional[str] = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        if path:
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Embedding cache disk tier disabled: {str(e)}")
+                self._conn = None
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Return the cached embedding for text, or None on a miss."""
+        key = cache_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return vector
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    print(f"Embedding cache read failed: {str(e)}")
+                    row = None
+                if row is not None:
+                    values = array("f")
+                    values.frombytes(row[0])
+                    vector = values.tolist()
+                    self._remember(key, vector)
+                    self.hits_disk += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """get for each text, in order."""
+        return [self.get(model, text) for text in texts]
+
+    def put(self, model: str, text: str, vector: List[float]) -> None:
+        """Store an embedding in both tiers."""
+        self.put_many(model, [text], [vector])
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """Store several embeddings in both tiers with a single disk commit."""
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = cache_key(model, text)
+                self._remember(key, list(vector))
+                rows.append((key, model, len(vector), array("f", vector).tobytes()))
+            if self._conn is not None and rows:
+                try:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)", rows
+                    )
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    print(f"Embedding cache write failed: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for this process."""
+        with self._lock:
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
@@ -5,6 +5,12 @@ import os
 from dotenv import load_dotenv
 import datetime
 import json
+import time
+import hashlib
+import uuid
+import queue
+import atexit
+import threading
 
 load_dotenv()
 
@@ -37,6 +43,118 @@ if not firebase_admin._apps:
         'databaseURL': os.getenv("FIREBASE_DATABASE_URL")
     })
 
+CHAT_LOG_FLUSH_INTERVAL = float(os.getenv("CHAT_LOG_FLUSH_INTERVAL", "1.0"))
+CHAT_LOG_MAX_BATCH = int(os.getenv("CHAT_LOG_MAX_BATCH", "200"))
+CHAT_LOG_MAX_ATTEMPTS = 5
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "50"))
+
+def record_key():
+    """Time-ordered, collision-free key for a chat record."""
+    return datetime.datetime.now().strftime("%Y-%m-%dT%H%M%S%f") + "-" + uuid.uuid4().hex[:8]
+
+class ChatLogWriter:
+    """Write-behind queue that flushes chat records to Firebase in multi-path update batches.
+
+    Records are buffered and written by one background thread, so no
+    network round trip sits on the response path. Pending records are
+    flushed at interpreter shutdown.
+    """
+
+    _STOP = object()
+
+    def __init__(self, flush_interval=CHAT_LOG_FLUSH_INTERVAL, max_batch=CHAT_LOG_MAX_BATCH):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, path, data):
+        """Schedule data to be written at path."""
+        self._queue.put((path, data, 0))
+
+    def _write(self, batch):
+        updates = {path: data for path, data, _ in batch}
+        try:
+            db.reference('/').update(updates)
+        except Exception as e:
+            print(f"Chat log flush of {len(batch)} records failed: {str(e)}")
+            for path, data, attempts in batch:
+                if attempts + 1 < CHAT_LOG_MAX_ATTEMPTS:
+                    self._queue.put((path, data, attempts + 1))
+                else:
+                    print(f"Dropping chat log record {path} after {CHAT_LOG_MAX_ATTEMPTS} attempts")
+            # Back off before the re-queued records are retried
+            time.sleep(self.flush_interval)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            deadline = datetime.datetime.now() + datetime.timedelta(seconds=self.flush_interval)
+            # Gather whatever else arrives within the flush interval into the same update
+            while len(batch) < self.max_batch:
+                remaining = (deadline - datetime.datetime.now()).total_seconds()
+                try:
+                    item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            if stop:
+                self._drain()
+                self._queue.task_done()
+                return
+
+    def _drain(self):
+        """Write everything still queued, used on shutdown."""
+        while True:
+            batch = []
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    self._queue.task_done()
+                    continue
+                batch.append(item)
+            if not batch:
+                return
+            self._write(batch)
+
+    def flush(self):
+        """Block until every record queued so far has been written or dropped."""
+        self._queue.join()
+
+    def close(self, timeout=10.0):
+        """Flush pending records and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+_chat_log_writer = None
+_chat_log_writer_lock = threading.Lock()
+
+def get_chat_log_writer():
+    """The process-wide chat log writer, started on first use."""
+    global _chat_log_writer
+    with _chat_log_writer_lock:
+        if _chat_log_writer is None:
+            _chat_log_writer = ChatLogWriter()
+        return _chat_log_writer
+
 def login():
     st.title("Login")
     email = st.text_input("Email", key="login_email")
@@ -101,47 +219,161 @@ def log_to_firebase(uid, email, status, error_message=None):
 
 
 
-def data_to_firebase(question, response, title):
+def data_to_firebase(question, response, title, conversation_id=None):
     if 'user_data' in st.session_state and st.session_state['user_data']:
         user_data = st.session_state['user_data']
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H%M%S")
         log_data = {
             "question": question,
             "response": response,
-            "title": title
+            "title": title,
+            "conversation_id": conversation_id
         }
 
         if 'uid' in user_data:
             uid = user_data['uid']
-            db.reference(f'users/{uid}/chat/{timestamp}').set(log_data)
-            st.success("Data logged successfully.")
+            key = record_key()
+            queue_write(f'users/{uid}/chat/{key}', log_data)
+            # Per-title index so title listings never touch the chat entries
+            queue_write(f'users/{uid}/titles/{title_key(title)}', {"title": title, "last_key": key})
         else:
             st.warning("User ID not found. Data not logged.")
     else:
         st.warning("User not logged in. Data not logged.")
 
+def title_key(title):
+    """Firebase-safe key for a conversation title."""
+    return hashlib.sha1((title or 'Untitled').encode("utf-8")).hexdigest()[:16]
+
+def history_cache():
+    """Per-session cache of history reads; this session's own queued writes are overlaid on it."""
+    return st.session_state.setdefault("firebase_history_cache", {})
+
+def session_writes():
+    """Records this session has queued for Firebase, by path.
+
+    The write-behind writer flushes up to CHAT_LOG_FLUSH_INTERVAL later, so a
+    read right after a write would miss them; every history read merges them in.
+    """
+    return st.session_state.setdefault("firebase_session_writes", {})
+
+def queue_write(path, data):
+    """Queue a write-behind record and make it visible to this session's reads at once."""
+    get_chat_log_writer().enqueue(path, data)
+    session_writes()[path] = data
+
+def with_session_writes(prefix, entries):
+    """entries (children of prefix as read from Firebase) plus this session's queued writes under prefix."""
+    merged = dict(entries or {})
+    for path, data in session_writes().items():
+        if path.startswith(prefix):
+            merged[path[len(prefix):]] = data
+    return merged
+
+def get_chat_page(uid, page_size=CHAT_PAGE_SIZE, before_key=None):
+    """One page of chat entries, newest last, plus the cursor for the page before it.
+
+    Only page_size entries are downloaded, however long the history is.
+    """
+    cache_key = ("page", uid, page_size, before_key)
+    cache = history_cache()
+    if cache_key not in cache:
+        query = db.reference(f'users/{uid}/chat').order_by_key()
+        if before_key is not None:
+            # end_at is inclusive, so fetch one extra and drop the cursor entry itself
+            entries = query.end_at(before_key).limit_to_last(page_size + 1).get() or {}
+            entries.pop(before_key, None)
+        else:
+            entries = query.limit_to_last(page_size).get() or {}
+        cache[cache_key] = entries
+    entries = with_session_writes(f'users/{uid}/chat/', cache[cache_key])
+    if before_key is not None:
+        entries = {key: data for key, data in entries.items() if key < before_key}
+    items = sorted(entries.items())[-page_size:]
+    next_cursor = items[0][0] if len(items) == page_size else None
+    return items, next_cursor
+
+def save_conversation_title(conversation_id, title):
+    """Store a conversation's title once, so no session has to summarize it again."""
+    if 'user_data' in st.session_state and st.session_state['user_data']:
+        uid = st.session_state['user_data']['uid']
+        queue_write(f'users/{uid}/conversations/{conversation_id}', {
+            "title": title,
+            "created": datetime.datetime.now().strftime("%Y-%m-%dT%H%M%S")
+        })
+
+def load_conversation_titles():
+    """Titles of the user's stored conversations, keyed by conversation id."""
+    if 'user_data' in st.session_state and st.session_state['user_data']:
+        uid = st.session_state['user_data']['uid']
+        cache = history_cache()
+        if ("conversations", uid) not in cache:
+            cache[("conversations", uid)] = db.reference(f'users/{uid}/conversations').get() or {}
+        conversations = with_session_writes(f'users/{uid}/conversations/', cache[("conversations", uid)])
+        return {conv_id: entry.get('title', 'Untitled') for conv_id, entry in conversations.items()}
+    return {}
+
+def get_conversation_messages(conversation_id):
+    """Messages of one stored conversation, oldest first.
+
+    Requires ".indexOn": ["conversation_id"] on users/$uid/chat in the database rules.
+    """
+    if 'user_data' in st.session_state and st.session_state['user_data']:
+        uid = st.session_state['user_data']['uid']
+        cache = history_cache()
+        if ("messages", uid, conversation_id) not in cache:
+            cache[("messages", uid, conversation_id)] = (
+                db.reference(f'users/{uid}/chat').order_by_child('conversation_id').equal_to(conversation_id).get()
+            )
+        chat = with_session_writes(f'users/{uid}/chat/', cache[("messages", uid, conversation_id)])
+        entries = {key: data for key, data in chat.items() if data.get('conversation_id') == conversation_id}
+        messages = []
+        for _, data in sorted(entries.items()):
+            messages.append({"role": "user", "content": data.get('question', '')})
+            messages.append({"role": "assistant", "content": data.get('response', '')})
+        return messages
+    return []
+
+def backfill_title_index(uid):
+    """Build the per-title index from the full chat log, once per user.
+
+    Histories written before the index existed have chat entries but no
+    titles; the titles_indexed flag keeps later sessions from rescanning.
+    """
+    chat = db.reference(f'users/{uid}/chat').get() or {}
+    index = {}
+    for key, data in sorted(chat.items()):
+        title = data.get('title') or 'Untitled'
+        index[title_key(title)] = {"title": title, "last_key": key}
+    if index:
+        db.reference(f'users/{uid}/titles').update(index)
+    db.reference(f'users/{uid}/titles_indexed').set(True)
+    return index
+
 def get_conversation_titles():
     if 'user_data' in st.session_state and st.session_state['user_data']:
         user_data = st.session_state['user_data']
         uid = user_data['uid']
-        user_chat = db.reference(f'users/{uid}/chat').get()
+        cache = history_cache()
+        if ("titles", uid) not in cache:
+            titles = db.reference(f'users/{uid}/titles').get() or {}
+            if not db.reference(f'users/{uid}/titles_indexed').get():
+                titles = {**titles, **backfill_title_index(uid)}
+            cache[("titles", uid)] = titles
+        titles = with_session_writes(f'users/{uid}/titles/', cache[("titles", uid)])
         
-        if user_chat:
-            titles = [entry.get('title', 'Untitled') for entry in user_chat.values()]
-            return list(set(titles))
+        if titles:
+            return list({entry.get('title', 'Untitled') for entry in titles.values()})
         
     return []
 
 
-def get_recent_questions():
+def get_recent_questions(n=10):
     if 'user_data' in st.session_state and st.session_state['user_data']:
         user_data = st.session_state['user_data']
         uid = user_data['uid']
-        user_chat = db.reference(f'users/{uid}/chat').get()
+        items, _ = get_chat_page(uid, page_size=n)
         
-        if user_chat:
-            questions = [entry.get('question', '') for entry in user_chat.values()]
-            return questions[-10:] 
+        return [entry.get('question', '') for _, entry in items]
         
     return []
 
@@ -160,11 +392,12 @@ def convert_chat_log(log_content):
     return result
 
 
-def get_conversation_data(uid):
-    user_chat = db.reference(f'users/{uid}/chat').get()
-    if user_chat:
+def get_conversation_data(uid, page_size=CHAT_PAGE_SIZE, before_key=None):
+    """Conversations in one page of history, grouped by title; pass the page's first key to go back."""
+    items, _ = get_chat_page(uid, page_size, before_key)
+    if items:
         conversations = {}
-        for timestamp, data in user_chat.items():
+        for timestamp, data in items:
             title = data.get('title', 'Untitled')
             if title not in conversations:
                 conversations[title] = []
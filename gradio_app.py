@@ -1,16 +1,32 @@
 import os
 import json
+import time
+import asyncio
 import openai
-import requests
+import httpx
 import gradio as gr
-from typing import List, Dict, Any
-from bs4 import BeautifulSoup
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, AsyncIterator, Tuple, Optional
 from tqdm import tqdm
 import markdown2
 
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-from qdrant_client.http.models import Filter, PointStruct
+from qdrant_client import QdrantClient, AsyncQdrantClient
+
+from embedding_cache import EmbeddingCache, cache_key
+from retrieval import (create_backend, build_filters, load_lexical_backend, reciprocal_rank_fusion,
+                       RETRIEVAL_BACKEND, QDRANT_PREFER_GRPC)
+from lexical_index import is_identifier_query
+from answer_cache import SemanticAnswerCache, ANSWER_CACHE_ENABLED, INDEX_VERSION_CHECK_INTERVAL, read_index_version
+from news_cache import RefreshingCache
+from metrics import (span, annotate, start_trace, trace_request, record_cache_lookup, record_usage,
+                     record_search, record_prompt_tokens, render_metrics)
+from chunking import count_tokens
+from context_packing import pack_context, truncate_tokens, CONTEXT_TOKEN_BUDGET
+from circular_fetcher import CircularFetcher
+from corpus_store import load_corpus_store
 
 # Configuration - Replace with environment variables in production
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "YOUR_OPENAI_API_KEY")
@@ -19,104 +35,325 @@ QDRANT_URL = os.environ.get("QDRANT_URL", "YOUR_QDRANT_URL")
 COLLECTION_NAME = os.environ.get("QDRANT_COLLECTION_NAME", "rbi_circulars")
 EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
 LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-3.5-turbo")
+CHUNK_OVERFETCH = int(os.environ.get("CHUNK_OVERFETCH", "4"))
+CHUNKS_PER_CIRCULAR = int(os.environ.get("CHUNKS_PER_CIRCULAR", "2"))
+DEPARTMENTS = [
+    "Department of Regulation",
+    "Department of Supervision",
+    "Department of Payment and Settlement Systems",
+    "Department of Currency Management",
+    "Foreign Exchange Department",
+    "Financial Inclusion and Development Department",
+    "Financial Markets Regulation Department",
+    "Financial Markets Operation Department",
+    "Monetary Policy Department",
+]
+GRADIO_CONCURRENCY_LIMIT = int(os.environ.get("GRADIO_CONCURRENCY_LIMIT", "32"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "64"))
+MAX_COMPLETION_TOKENS = int(os.environ.get("MAX_COMPLETION_TOKENS", "1000"))
+MODEL_CONTEXT_TOKENS = int(os.environ.get("MODEL_CONTEXT_TOKENS", "16385"))
+EXPAND_TOP_N = int(os.environ.get("EXPAND_TOP_N", "0"))
+EXPAND_MAX_TOKENS = int(os.environ.get("EXPAND_MAX_TOKENS", "1500"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_QUERIES = int(os.environ.get("BATCH_MAX_QUERIES", "500"))
+# Inputs per embeddings request; the API accepts up to 2048
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "256"))
 
 # Initialize clients
 client = openai.OpenAI(api_key=OPENAI_API_KEY)
 qdrant_client = QdrantClient(
     url=QDRANT_URL,
-    api_key=QDRANT_API_KEY
+    api_key=QDRANT_API_KEY,
+    prefer_grpc=QDRANT_PREFER_GRPC
+)
+# Async clients for the request path; each shares one keep-alive connection pool across requests
+async_client = openai.AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+        timeout=httpx.Timeout(60.0, connect=10.0)
+    )
+)
+async_qdrant_client = AsyncQdrantClient(
+    url=QDRANT_URL,
+    api_key=QDRANT_API_KEY,
+    prefer_grpc=QDRANT_PREFER_GRPC
 )
+embedding_cache = EmbeddingCache()
+corpus_store = load_corpus_store()
+retrieval_backend = create_backend(qdrant_client, async_qdrant_client, COLLECTION_NAME, corpus_store=corpus_store)
+lexical_backend = load_lexical_backend()
+
+
+def poll_index_version() -> Optional[str]:
+    """Read the index version, reloading the lexical index after a re-index changed it.
+
+    ingest.py rebuilds the lexical index before it bumps the version, so the
+    files are complete by the time a new version is seen.
+    """
+    global lexical_backend
+    version = read_index_version(qdrant_client, COLLECTION_NAME)
+    if index_version.loaded_at is not None and version != index_version.value:
+        lexical_backend = load_lexical_backend()
+    return version
+
+
+# Polled in the background so lookups never wait on Qdrant
+index_version = RefreshingCache(
+    poll_index_version,
+    ttl=INDEX_VERSION_CHECK_INTERVAL,
+    refresh_interval=INDEX_VERSION_CHECK_INTERVAL,
+    name="index version"
+).start()
+answer_cache = None
+if ANSWER_CACHE_ENABLED:
+    answer_cache = SemanticAnswerCache(version_source=lambda: index_version.get(block=False))
+circular_fetcher = CircularFetcher()
 
 def get_embedding(text: str) -> List[float]:
-    """Generate embeddings for the given text."""
-    response = client.embeddings.create(
-        input=text,
-        model=EMBEDDING_MODEL
-    )
-    return response.data[0].embedding
+    """Generate embeddings for the given text, served from the cache when possible."""
+    with span("embed") as attrs:
+        cached = embedding_cache.get(EMBEDDING_MODEL, text)
+        record_cache_lookup("embedding", cached is not None)
+        attrs["cache_hit"] = cached is not None
+        if cached is not None:
+            return cached
 
-def search_circulars(query: str, limit: int = 5) -> List[Dict[str, Any]]:
-    """Search for relevant circulars based on the query."""
-    query_embedding = get_embedding(query)
-    
-    # Version-agnostic approach to search in Qdrant
-    try:
-        # Try multiple approaches to handle different Qdrant client versions
-        try:
-            # First try the newer API (1.1.0+)
-            search_results = qdrant_client.search(
-                collection_name=COLLECTION_NAME,
-                query_vector=query_embedding,
-                limit=limit
-            )
-        except (TypeError, AssertionError):
-            # Try alternative approach with explicit models
-            search_request = models.SearchRequest(
-                vector=query_embedding,
-                limit=limit
-            )
-            search_results = qdrant_client.search(
-                collection_name=COLLECTION_NAME,
-                search_request=search_request
+        response = client.embeddings.create(
+            input=text,
+            model=EMBEDDING_MODEL
+        )
+        attrs["tokens"] = response.usage.total_tokens
+        embedding = response.data[0].embedding
+        embedding_cache.put(EMBEDDING_MODEL, text, embedding)
+        return embedding
+
+async def get_embedding_async(text: str) -> List[float]:
+    """Async variant of get_embedding; the SQLite-backed cache is read and written off the event loop."""
+    with span("embed") as attrs:
+        cached = await asyncio.to_thread(embedding_cache.get, EMBEDDING_MODEL, text)
+        record_cache_lookup("embedding", cached is not None)
+        attrs["cache_hit"] = cached is not None
+        if cached is not None:
+            return cached
+
+        response = await async_client.embeddings.create(
+            input=text,
+            model=EMBEDDING_MODEL
+        )
+        attrs["tokens"] = response.usage.total_tokens
+        embedding = response.data[0].embedding
+        await asyncio.to_thread(embedding_cache.put, EMBEDDING_MODEL, text, embedding)
+        return embedding
+
+async def get_embeddings_async(texts: List[str]) -> List[List[float]]:
+    """Embed many texts, sending only the cache misses to the API, EMBEDDING_BATCH_SIZE per request."""
+    with span("embed_batch", texts=len(texts)) as attrs:
+        # Texts that normalize alike share one cache entry and one API input
+        keys = [cache_key(EMBEDDING_MODEL, text) for text in texts]
+        unique = dict(zip(keys, texts))
+        cached = await asyncio.to_thread(embedding_cache.get_many, EMBEDDING_MODEL, list(unique.values()))
+        vectors = dict(zip(unique, cached))
+        missing = [key for key, vector in vectors.items() if vector is None]
+        for vector in cached:
+            record_cache_lookup("embedding", vector is not None)
+        attrs["unique_texts"] = len(unique)
+        attrs["cache_hits"] = len(unique) - len(missing)
+        attrs["tokens"] = 0
+        for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+            batch = missing[start:start + EMBEDDING_BATCH_SIZE]
+            response = await async_client.embeddings.create(
+                input=[unique[key] for key in batch],
+                model=EMBEDDING_MODEL
             )
-    except Exception as e:
-        print(f"Error with search methods: {str(e)}")
-        try:
-            # Last resort: Try query_points for newest versions
-            search_results = qdrant_client.query_points(
-                collection_name=COLLECTION_NAME,
-                vector=query_embedding,
-                limit=limit
-            ).points
-        except Exception as e2:
-            print(f"Error with query_points: {str(e2)}")
-            # If all else fails, return empty results
-            return []
-    
-    results = []
+            attrs["tokens"] += response.usage.total_tokens
+            embedded = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            vectors.update(zip(batch, embedded))
+            await asyncio.to_thread(embedding_cache.put_many, EMBEDDING_MODEL,
+                                    [unique[key] for key in batch], embedded)
+        return [vectors[key] for key in keys]
+
+def get_embedding_cache_stats() -> Dict[str, int]:
+    """Expose the embedding cache hit/miss counters."""
+    return embedding_cache.stats()
+
+def group_chunk_hits(search_results, limit: int) -> List[Dict[str, Any]]:
+    """Collapse chunk-level hits into one result per circular, best score first."""
+    circulars = {}
     for result in search_results:
-        results.append({
-            "score": getattr(result, "score", 0.0),
-            "circular_number": result.payload.get("circular_number", "N/A"),
-            "title": result.payload.get("title", "Untitled"),
-            "department": result.payload.get("department", "N/A"),
-            "date": result.payload.get("date", "N/A"),
-            "meant_for": result.payload.get("meant_for", "N/A"),
-            "link": result.payload.get("link", "#"),
-            "preview": result.payload.get("text", "No preview available")
+        payload = result.payload or {}
+        parent_id = payload.get("parent_id", str(result.id))
+        if parent_id not in circulars:
+            if len(circulars) >= limit:
+                continue
+            circulars[parent_id] = {
+                "id": parent_id,
+                "score": getattr(result, "score", 0.0),
+                "circular_number": payload.get("circular_number", "N/A"),
+                "title": payload.get("title", "Untitled"),
+                "department": payload.get("department", "N/A"),
+                "date": payload.get("date", "N/A"),
+                "meant_for": payload.get("meant_for", "N/A"),
+                "link": payload.get("link", "#"),
+                "chunks": [],
+                "passages": []
+            }
+        chunks = circulars[parent_id]["chunks"]
+        if len(chunks) < CHUNKS_PER_CIRCULAR:
+            chunks.append((payload.get("chunk_index", 0), payload.get("text", "")))
+        # Every matched chunk is offered to the context packer with its own score
+        circulars[parent_id]["passages"].append({
+            "chunk_index": payload.get("chunk_index", 0),
+            "text": payload.get("text", ""),
+            "score": getattr(result, "score", 0.0)
         })
-    
+
+    results = []
+    for circular in circulars.values():
+        # Matched passages are shown in document order rather than score order
+        chunks = sorted(circular.pop("chunks"))
+        circular["preview"] = "\n...\n".join(text for _, text in chunks if text) or "No preview available"
+        results.append(circular)
     return results
 
+def lexical_lookup(query: str, chunk_limit: int, filters: Optional[Dict[str, Any]] = None) -> Optional[List[Any]]:
+    """Answer reference-number lookups from the lexical index alone, skipping the embedding call."""
+    if lexical_backend is None or not is_identifier_query(query):
+        return None
+    with span("lexical_lookup") as attrs:
+        hits = lexical_backend.search(query, chunk_limit, filters)
+        record_search("lexical", hits, attrs)
+    return hits or None
+
+def fuse_with_lexical(query: str, dense_hits: List[Any], chunk_limit: int,
+                      filters: Optional[Dict[str, Any]] = None) -> List[Any]:
+    """Merge dense hits with BM25 hits by reciprocal-rank fusion when a lexical index is loaded."""
+    if lexical_backend is None:
+        return dense_hits
+    with span("lexical_search") as attrs:
+        lexical_hits = lexical_backend.search(query, chunk_limit, filters)
+        record_search("lexical", lexical_hits, attrs)
+    return reciprocal_rank_fusion([dense_hits, lexical_hits], chunk_limit)
+
+def retrieve(query: str, limit: int = 5,
+             filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[List[float]]]:
+    """Retrieve circulars for the query, also returning the query embedding when one was computed."""
+    # Several chunks of one circular can match, so over-fetch before grouping
+    chunk_limit = limit * CHUNK_OVERFETCH
+    query_embedding = None
+    search_results = lexical_lookup(query, chunk_limit, filters)
+    if search_results is None:
+        query_embedding = get_embedding(query)
+        with span("search", backend=RETRIEVAL_BACKEND) as attrs:
+            dense_hits = retrieval_backend.search(query_embedding, chunk_limit, filters)
+            record_search(RETRIEVAL_BACKEND, dense_hits, attrs)
+        search_results = fuse_with_lexical(query, dense_hits, chunk_limit, filters)
+    return group_chunk_hits(search_results, limit), query_embedding
+
+async def retrieve_async(query: str, limit: int = 5,
+                         filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[List[float]]]:
+    """Async variant of retrieve."""
+    chunk_limit = limit * CHUNK_OVERFETCH
+    query_embedding = None
+    search_results = lexical_lookup(query, chunk_limit, filters)
+    if search_results is None:
+        query_embedding = await get_embedding_async(query)
+        with span("search", backend=RETRIEVAL_BACKEND) as attrs:
+            dense_hits = await retrieval_backend.search_async(query_embedding, chunk_limit, filters)
+            record_search(RETRIEVAL_BACKEND, dense_hits, attrs)
+        search_results = fuse_with_lexical(query, dense_hits, chunk_limit, filters)
+    return group_chunk_hits(search_results, limit), query_embedding
+
+async def retrieve_batch_async(queries: List[str], limit: int = 5, filters: Optional[Dict[str, Any]] = None
+                               ) -> List[Tuple[List[Dict[str, Any]], Optional[List[float]]]]:
+    """retrieve for many queries with one embeddings request and one batched vector search."""
+    chunk_limit = limit * CHUNK_OVERFETCH
+    results = [lexical_lookup(query, chunk_limit, filters) for query in queries]
+    embeddings = [None] * len(queries)
+    dense_indexes = [i for i, hits in enumerate(results) if hits is None]
+    if dense_indexes:
+        vectors = await get_embeddings_async([queries[i] for i in dense_indexes])
+        with span("search_batch", backend=RETRIEVAL_BACKEND, queries=len(vectors)):
+            dense_results = await retrieval_backend.search_batch_async(vectors, chunk_limit, filters)
+        for i, vector, dense_hits in zip(dense_indexes, vectors, dense_results):
+            record_search(RETRIEVAL_BACKEND, dense_hits)
+            embeddings[i] = vector
+            results[i] = fuse_with_lexical(queries[i], dense_hits, chunk_limit, filters)
+    return [(group_chunk_hits(hits, limit), embedding) for hits, embedding in zip(results, embeddings)]
+
+def search_circulars(query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Search for relevant circulars based on the query, restricted to circulars matching filters."""
+    return retrieve(query, limit, filters)[0]
+
+async def search_circulars_async(query: str, limit: int = 5,
+                                 filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Async variant of search_circulars."""
+    return (await retrieve_async(query, limit, filters))[0]
+
+def can_expand(doc: Dict[str, Any]) -> bool:
+    return doc["link"].startswith("http")
+
+def answer_cache_key(retrieved_docs: List[Dict[str, Any]], expand_top_n: int = 0) -> List[str]:
+    """Retrieved circular ids, marking those answered from full text so expanded answers are cached apart.
+
+    Docs that expand_full_text actually expanded are marked. Before expansion,
+    expand_top_n marks the docs a request is going to try to expand.
+    """
+    return [
+        f"{doc['id']}:full" if doc.get("expanded") or (i < expand_top_n and can_expand(doc)) else doc["id"]
+        for i, doc in enumerate(retrieved_docs)
+    ]
+
+def cached_answer(query_embedding: Optional[List[float]], retrieved_docs: List[Dict[str, Any]],
+                  expand_top_n: int = 0) -> Optional[Tuple[str, str]]:
+    """A stored (answer, html) for a near-identical query that retrieved the same circulars."""
+    if answer_cache is None or query_embedding is None:
+        return None
+    cached = answer_cache.lookup(query_embedding, answer_cache_key(retrieved_docs, expand_top_n))
+    record_cache_lookup("answer", cached is not None)
+    annotate(answer_cache_hit=cached is not None)
+    return cached
+
+def cache_answer(query_embedding: Optional[List[float]], retrieved_docs: List[Dict[str, Any]],
+                 answer: str, html: str) -> None:
+    """Remember a successful answer in the semantic answer cache, keyed by the docs it was really built from."""
+    if answer_cache is None or query_embedding is None or answer.startswith(GENERATION_ERROR_PREFIX):
+        return
+    answer_cache.store(query_embedding, answer_cache_key(retrieved_docs), answer, html)
+
 def fetch_full_circular_content(url: str) -> str:
-    """Fetch the full content of a circular from its URL."""
+    """Fetch the full content of a circular from its URL (cached on disk, over a pooled session)."""
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        content_div = soup.find('div', class_='content')
-        if content_div:
-            return content_div.get_text(strip=True)
-        else:
-            return "Full content could not be extracted. Please visit the original link."
+        text = circular_fetcher.fetch(url)
     except Exception as e:
         return f"Error fetching content: {str(e)}"
+    return text or "Full content could not be extracted. Please visit the original link."
 
-def generate_response(query: str, retrieved_docs: List[Dict[str, Any]]) -> str:
-    """Generate an LLM response based on the query and retrieved documents."""
-    if not retrieved_docs:
-        return "No relevant documents were found to answer your query. Please try a different question."
-    
-    context = ""
-    for i, doc in enumerate(retrieved_docs):
-        context += f"Document {i+1}:\n"
-        context += f"Title: {doc['title']}\n"
-        context += f"Circular Number: {doc['circular_number']}\n"
-        context += f"Department: {doc['department']}\n"
-        context += f"Date: {doc['date']}\n"
-        context += f"Preview: {doc['preview']}\n\n"
-    
-    prompt = f"""You are an RBI policy expert. Use the following RBI circulars to answer the user's question.
+def expand_full_text(retrieved_docs: List[Dict[str, Any]], top_n: int) -> None:
+    """Offer the full text of the top_n circulars to the context packer, fetched concurrently."""
+    docs = [doc for doc in retrieved_docs[:top_n] if can_expand(doc)]
+    if not docs:
+        return
+    with span("expand", circulars=len(docs)) as attrs:
+        texts = circular_fetcher.fetch_many([doc["link"] for doc in docs])
+        expanded = 0
+        for doc in docs:
+            text = texts.get(doc["link"])
+            if not text:
+                continue
+            if count_tokens(text) > EXPAND_MAX_TOKENS:
+                text = truncate_tokens(text, EXPAND_MAX_TOKENS)
+            # Ranked level with the circular's best chunk and ahead of it, so the chunks it contains dedupe away
+            doc["passages"].insert(0, {"chunk_index": -1, "text": text, "score": doc["score"]})
+            doc["expanded"] = True
+            expanded += 1
+        attrs["expanded"] = expanded
+
+SYSTEM_PROMPT = "You are a helpful assistant specializing in RBI policies and circulars."
+NO_DOCUMENTS_MESSAGE = "No relevant documents were found to answer your query. Please try a different question."
+GENERATION_ERROR_PREFIX = "Error generating response"
+
+PROMPT_TEMPLATE = """You are an RBI policy expert. Use the following RBI circulars to answer the user's question.
 If the information is not in the circulars, say you don't know.
 
 User Query: {query}
@@ -126,21 +363,90 @@ Retrieved Circulars:
 
 Please provide a comprehensive answer based on the information in these circulars.
 """
+
+def build_prompt(query: str, retrieved_docs: List[Dict[str, Any]]) -> str:
+    """Build the user prompt from the query and the retrieved passages that fit the token budget."""
+    with span("pack") as attrs:
+        overhead = count_tokens(SYSTEM_PROMPT) + count_tokens(PROMPT_TEMPLATE.format(query=query, context=""))
+        # Whatever the configured budget, the prompt and the completion must fit the model's window
+        budget = min(CONTEXT_TOKEN_BUDGET, MODEL_CONTEXT_TOKENS - MAX_COMPLETION_TOKENS - overhead)
+        context, stats = pack_context(retrieved_docs, budget)
+        attrs.update(stats)
+        attrs["prompt_tokens"] = overhead + stats["context_tokens"]
+        record_prompt_tokens(attrs["prompt_tokens"])
+    return PROMPT_TEMPLATE.format(query=query, context=context)
+
+def generate_response(query: str, retrieved_docs: List[Dict[str, Any]]) -> str:
+    """Generate an LLM response based on the query and retrieved documents."""
+    if not retrieved_docs:
+        return NO_DOCUMENTS_MESSAGE
     
+    prompt = build_prompt(query, retrieved_docs)
     try:
-        response = client.chat.completions.create(
+        with span("generate") as attrs:
+            response = client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=MAX_COMPLETION_TOKENS
+            )
+            record_usage(response.usage, attrs)
+        return response.choices[0].message.content
+    except Exception as e:
+        return f"{GENERATION_ERROR_PREFIX}: {str(e)}"
+
+async def generate_response_async(query: str, retrieved_docs: List[Dict[str, Any]]) -> str:
+    """Async variant of generate_response."""
+    if not retrieved_docs:
+        return NO_DOCUMENTS_MESSAGE
+
+    prompt = build_prompt(query, retrieved_docs)
+    try:
+        with span("generate") as attrs:
+            response = await async_client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=MAX_COMPLETION_TOKENS
+            )
+            record_usage(response.usage, attrs)
+        return response.choices[0].message.content
+    except Exception as e:
+        return f"{GENERATION_ERROR_PREFIX}: {str(e)}"
+
+async def generate_response_stream(query: str, retrieved_docs: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Stream the LLM response as text deltas."""
+    if not retrieved_docs:
+        yield NO_DOCUMENTS_MESSAGE
+        return
+
+    prompt = build_prompt(query, retrieved_docs)
+    with span("generate", stream=True) as attrs:
+        stream = await async_client.chat.completions.create(
             model=LLM_MODEL,
             messages=[
-                {"role": "system", "content": "You are a helpful assistant specializing in RBI policies and circulars."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.3,
-            max_tokens=1000
+            max_tokens=MAX_COMPLETION_TOKENS,
+            stream=True,
+            stream_options={"include_usage": True}
         )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error generating response: {str(e)}"
+        async for chunk in stream:
+            # With include_usage the final chunk carries token counts and no choices
+            if chunk.usage is not None:
+                record_usage(chunk.usage, attrs)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
+@span("render")
 def format_results_html(results: List[Dict[str, Any]]) -> str:
     """Format the search results as HTML for display."""
     if not results:
@@ -179,25 +485,42 @@ def format_results_html(results: List[Dict[str, Any]]) -> str:
     html += "</div>"
     return html
 
-def rag_query(query, num_results=5):
-    """Main RAG function that handles the entire process."""
+def parse_num_results(num_results, default: int = 5) -> int:
+    """Coerce a slider value to an int, falling back to default."""
+    try:
+        return int(num_results)
+    except (TypeError, ValueError):
+        return default
+
+def rag_query(query, num_results=5, filters=None, expand_top_n=EXPAND_TOP_N):
+    """Main RAG function that handles the entire process.
+
+    expand_top_n > 0 answers from the full text of that many top circulars
+    instead of only their matched chunks.
+    """
+    with trace_request("rag_query"):
+        return _rag_query(query, num_results, filters, expand_top_n)
+
+def _rag_query(query, num_results=5, filters=None, expand_top_n=EXPAND_TOP_N):
     if not query or not isinstance(query, str) or not query.strip():
         return "Please enter a valid query.", ""
     
-    # Ensure num_results is an integer
-    try:
-        num_results = int(num_results)
-    except (TypeError, ValueError):
-        num_results = 5  # Default to 5 if conversion fails
+    num_results = parse_num_results(num_results)
     
     try:
-        retrieved_docs = search_circulars(query, limit=num_results)
+        retrieved_docs, query_embedding = retrieve(query, limit=num_results, filters=filters)
         
         if not retrieved_docs:
             return "No relevant circulars found for your query. Please try different search terms.", ""
         
+        cached = cached_answer(query_embedding, retrieved_docs, expand_top_n)
+        if cached is not None:
+            return cached
+        
+        expand_full_text(retrieved_docs, expand_top_n)
         llm_response = generate_response(query, retrieved_docs)
         formatted_results = format_results_html(retrieved_docs)
+        cache_answer(query_embedding, retrieved_docs, llm_response, formatted_results)
         
         return llm_response, formatted_results
     except Exception as e:
@@ -205,6 +528,184 @@ def rag_query(query, num_results=5):
         print(error_message)  # Log the error
         return error_message, ""
 
+async def rag_query_async(query, num_results=5, filters=None, expand_top_n=EXPAND_TOP_N):
+    """Asyncio-native RAG path; awaits network I/O so one worker can serve many users."""
+    with trace_request("rag_query_async"):
+        return await _rag_query_async(query, num_results, filters, expand_top_n)
+
+async def _rag_query_async(query, num_results=5, filters=None, expand_top_n=EXPAND_TOP_N):
+    if not query or not isinstance(query, str) or not query.strip():
+        return "Please enter a valid query.", ""
+
+    num_results = parse_num_results(num_results)
+
+    try:
+        retrieved_docs, query_embedding = await retrieve_async(query, limit=num_results, filters=filters)
+
+        if not retrieved_docs:
+            return "No relevant circulars found for your query. Please try different search terms.", ""
+
+        cached = cached_answer(query_embedding, retrieved_docs, expand_top_n)
+        if cached is not None:
+            return cached
+
+        await asyncio.to_thread(expand_full_text, retrieved_docs, expand_top_n)
+        llm_response = await generate_response_async(query, retrieved_docs)
+        formatted_results = format_results_html(retrieved_docs)
+        cache_answer(query_embedding, retrieved_docs, llm_response, formatted_results)
+
+        return llm_response, formatted_results
+    except Exception as e:
+        error_message = f"An error occurred while processing your query: {str(e)}"
+        print(error_message)  # Log the error
+        return error_message, ""
+
+def circular_summary(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a retrieved circular that a batch result reports."""
+    return {key: doc.get(key) for key in ("id", "title", "circular_number", "department", "date", "link", "score")}
+
+async def rag_query_batch(queries: List[str], num_results=5, filters=None,
+                          concurrency: int = BATCH_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+    """Answer many queries, yielding one result dict per query as soon as its answer is ready.
+
+    Retrieval for the whole batch costs one embeddings request and one
+    batched vector search; at most concurrency completions run at once.
+    Results arrive in completion order, each carrying its index in queries.
+    """
+    request_trace = start_trace("rag_query_batch")
+    tasks = []
+    try:
+        num_results = parse_num_results(num_results)
+        valid = []
+        for i, query in enumerate(queries):
+            if isinstance(query, str) and query.strip():
+                valid.append(i)
+            else:
+                yield {"index": i, "query": query, "answer": "Please enter a valid query.",
+                       "circulars": [], "cached": False, "error": True}
+        annotate(queries=len(queries))
+        try:
+            retrieved = await retrieve_batch_async([queries[i] for i in valid], num_results, filters)
+        except Exception as e:
+            error_message = f"An error occurred while processing your query: {str(e)}"
+            print(error_message)  # Log the error
+            for i in valid:
+                yield {"index": i, "query": queries[i], "answer": error_message, "circulars": [],
+                       "cached": False, "error": True}
+            return
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def answer(index: int, retrieved_docs: List[Dict[str, Any]],
+                         query_embedding: Optional[List[float]]) -> Dict[str, Any]:
+            async with semaphore:
+                start = time.perf_counter()
+                query = queries[index]
+                result = {"index": index, "query": query,
+                          "circulars": [circular_summary(doc) for doc in retrieved_docs], "cached": False}
+                if not retrieved_docs:
+                    result["answer"] = "No relevant circulars found for your query. Please try different search terms."
+                else:
+                    cached = cached_answer(query_embedding, retrieved_docs)
+                    if cached is not None:
+                        result["answer"], result["cached"] = cached[0], True
+                    else:
+                        result["answer"] = await generate_response_async(query, retrieved_docs)
+                        cache_answer(query_embedding, retrieved_docs, result["answer"],
+                                     format_results_html(retrieved_docs))
+                result["error"] = result["answer"].startswith(GENERATION_ERROR_PREFIX)
+                result["seconds"] = round(time.perf_counter() - start, 3)
+                return result
+
+        tasks = [asyncio.ensure_future(answer(i, docs, embedding))
+                 for i, (docs, embedding) in zip(valid, retrieved)]
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # A client that disconnects mid-stream should not leave completions running
+        for task in tasks:
+            task.cancel()
+        request_trace.finish()
+
+def format_timing(first_token: float, total: float) -> str:
+    """Render time-to-first-token and total latency for the UI."""
+    if first_token is None:
+        return f"*Total: {total:.2f}s*"
+    return f"*First token: {first_token:.2f}s · Total: {total:.2f}s*"
+
+async def rag_query_stream(query, num_results=5, filters=None,
+                           expand_top_n=EXPAND_TOP_N) -> AsyncIterator[Tuple[str, str, str]]:
+    """Streaming RAG path: render retrieved circulars at once, then stream the answer."""
+    # A generator cannot hold a context-manager-scoped trace across its yields, so finish it explicitly
+    request_trace = start_trace("rag_query_stream")
+    try:
+        async for update in _rag_query_stream(query, num_results, filters, expand_top_n):
+            yield update
+    finally:
+        request_trace.finish()
+
+async def _rag_query_stream(query, num_results=5, filters=None,
+                            expand_top_n=EXPAND_TOP_N) -> AsyncIterator[Tuple[str, str, str]]:
+    start = time.perf_counter()
+    if not query or not isinstance(query, str) or not query.strip():
+        yield "Please enter a valid query.", "", ""
+        return
+
+    num_results = parse_num_results(num_results)
+    answer = ""
+    formatted_results = ""
+    first_token = None
+    try:
+        retrieved_docs, query_embedding = await retrieve_async(query, limit=num_results, filters=filters)
+
+        if not retrieved_docs:
+            yield "No relevant circulars found for your query. Please try different search terms.", "", ""
+            return
+
+        cached = cached_answer(query_embedding, retrieved_docs, expand_top_n)
+        if cached is not None:
+            yield cached[0], cached[1], f"*Cached answer · Total: {time.perf_counter() - start:.2f}s*"
+            return
+
+        formatted_results = format_results_html(retrieved_docs)
+        if expand_top_n > 0:
+            yield "*Reading full circulars...*", formatted_results, ""
+            await asyncio.to_thread(expand_full_text, retrieved_docs, expand_top_n)
+        yield "*Generating answer...*", formatted_results, ""
+
+        async for delta in generate_response_stream(query, retrieved_docs):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            answer += delta
+            yield answer, formatted_results, format_timing(first_token, time.perf_counter() - start)
+    except Exception as e:
+        error_message = f"An error occurred while processing your query: {str(e)}"
+        print(error_message)  # Log the error
+        yield (answer + "\n\n" + error_message).strip(), formatted_results, ""
+        return
+
+    cache_answer(query_embedding, retrieved_docs, answer, formatted_results)
+    yield answer, formatted_results, format_timing(first_token, time.perf_counter() - start)
+
+async def handle_query(query, num_results=5, stream=True, departments=None, date_from="", date_to="", meant_for="",
+                       expand_top_n=EXPAND_TOP_N):
+    """Gradio handler that streams the answer or returns it whole."""
+    try:
+        filters = build_filters(departments, date_from, date_to, meant_for)
+    except ValueError as e:
+        yield str(e), "", ""
+        return
+
+    if stream:
+        expand_top_n = parse_num_results(expand_top_n, default=0)
+        async for update in rag_query_stream(query, num_results, filters, expand_top_n):
+            yield update
+        return
+
+    start = time.perf_counter()
+    llm_response, formatted_results = await rag_query_async(query, num_results, filters,
+                                                            parse_num_results(expand_top_n, default=0))
+    yield llm_response, formatted_results, format_timing(None, time.perf_counter() - start)
+
 # Create the Gradio interface
 def create_interface():
     """Create the Gradio interface."""
@@ -227,20 +728,42 @@ def create_interface():
                     step=1,
                     label="Number of Results"
                 )
+                stream_answer = gr.Checkbox(value=True, label="Stream answer")
+                expand_top_n = gr.Slider(
+                    minimum=0,
+                    maximum=5,
+                    value=EXPAND_TOP_N,
+                    step=1,
+                    label="Read Full Text of Top Circulars"
+                )
+        
+        with gr.Accordion("Filters", open=False):
+            with gr.Row():
+                departments = gr.Dropdown(
+                    choices=DEPARTMENTS,
+                    multiselect=True,
+                    allow_custom_value=True,
+                    label="Department"
+                )
+                meant_for = gr.Textbox(label="Meant For", placeholder="E.g., Urban Co-operative Banks")
+            with gr.Row():
+                date_from = gr.Textbox(label="Issued On or After", placeholder="YYYY-MM-DD")
+                date_to = gr.Textbox(label="Issued On or Before", placeholder="YYYY-MM-DD")
         
         submit_btn = gr.Button("Search", variant="primary")
         
         with gr.Row():
             with gr.Column():
                 response_output = gr.Markdown(label="AI Response")
+                timing_output = gr.Markdown()
         
         with gr.Row():
             results_output = gr.HTML(label="Retrieved Circulars")
         
         submit_btn.click(
-            fn=rag_query,
-            inputs=[query_input, num_results],
-            outputs=[response_output, results_output]
+            fn=handle_query,
+            inputs=[query_input, num_results, stream_answer, departments, date_from, date_to, meant_for, expand_top_n],
+            outputs=[response_output, results_output, timing_output]
         )
         
         gr.Examples(
@@ -253,13 +776,52 @@ def create_interface():
             inputs=query_input
         )
         
-        return demo
+    # Async handlers run on the event loop, so allow many events in flight at once
+    demo.queue(default_concurrency_limit=GRADIO_CONCURRENCY_LIMIT)
+    return demo
+
+class BatchRequest(BaseModel):
+    queries: List[str]
+    # Same range as the UI slider; it sets the per-query search limit
+    num_results: int = Field(5, ge=1, le=10)
+    departments: Optional[List[str]] = None
+    date_from: str = ""
+    date_to: str = ""
+    meant_for: str = ""
+    concurrency: Optional[int] = Field(None, ge=1)
+
+def create_app(demo: gr.Blocks) -> FastAPI:
+    """Serve the Gradio UI at / with Prometheus /metrics and JSONL /batch routes alongside it."""
+    server = FastAPI()
+
+    @server.get("/metrics")
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+    @server.post("/batch")
+    async def batch(request: BatchRequest):
+        if len(request.queries) > BATCH_MAX_QUERIES:
+            raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+        try:
+            filters = build_filters(request.departments, request.date_from, request.date_to, request.meant_for)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        concurrency = min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+
+        async def lines():
+            async for result in rag_query_batch(request.queries, request.num_results, filters, concurrency):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return gr.mount_gradio_app(server, demo, path="/")
 
-# Create Gradio app for Render deployment
-app = create_interface()
+# Create the ASGI app for Render deployment
+demo = create_interface()
+app = create_app(demo)
 
 # Entry point for the application
 if __name__ == "__main__":
-    # Run locally when executed directly)
+    # Run locally when executed directly
     port = int(os.environ.get("PORT", 10000))
-    app.launch(server_name="0.0.0.0", server=port)
+    uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,563 @@
+import os
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from typing import List, Dict, Any, Iterator, Iterable, Callable, Set, Optional
+
+import openai
+from tqdm import tqdm
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+
+from chunking import CHUNK_TOKENS, CHUNK_OVERLAP, build_header, section_texts, chunk_circular
+from retrieval import parse_circular_date, qdrant_quantization_config
+from vector_store import VECTOR_QUANTIZATION
+from lexical_index import LexicalIndex, LEXICAL_INDEX_PATH
+from answer_cache import bump_index_version
+from corpus_store import CorpusStore, CorpusWriter, CORPUS_STORE_PATH
+
+# Configuration - Replace with environment variables in production
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "YOUR_OPENAI_API_KEY")
+QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY", "YOUR_QDRANT_API_KEY")
+QDRANT_URL = os.environ.get("QDRANT_URL", "YOUR_QDRANT_URL")
+COLLECTION_NAME = os.environ.get("QDRANT_COLLECTION_NAME", "rbi_circulars")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIMENSION = int(os.environ.get("EMBEDDING_DIMENSION", "1536"))
+
+EMBED_BATCH_SIZE = int(os.environ.get("INGEST_EMBED_BATCH_SIZE", "64"))
+MAX_IN_FLIGHT = int(os.environ.get("INGEST_MAX_IN_FLIGHT", "4"))
+MAX_RETRIES = int(os.environ.get("INGEST_MAX_RETRIES", "6"))
+SCROLL_PAGE_SIZE = 1000
+DELETE_BATCH_SIZE = 500
+# Bump whenever the payload layout changes; outdated points get new payloads without being re-embedded
+PAYLOAD_VERSION = 2
+
+# Payload fields filtered on at query time, indexed server-side
+PAYLOAD_INDEXES = {
+    "department": models.PayloadSchemaType.KEYWORD,
+    "date_value": models.PayloadSchemaType.INTEGER,
+    "parent_id": models.PayloadSchemaType.KEYWORD,
+    "meant_for": models.TextIndexParams(
+        type=models.TextIndexType.TEXT,
+        tokenizer=models.TokenizerType.WORD,
+        lowercase=True
+    ),
+}
+# Payload fields kept in Qdrant when the display fields are served from the corpus store:
+# the filtered ones, plus those reindex() reads back
+COMPACT_PAYLOAD_FIELDS = (
+    "parent_id", "chunk_index", "department", "date_value", "meant_for", "content_hash", "payload_version"
+)
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+    ResponseHandlingException,
+    UnexpectedResponse,
+)
+
+READ_CHUNK_SIZE = 1 << 16
+
+
+def iter_json_array(path: str, key: str = "circulars") -> Iterator[Dict[str, Any]]:
+    """Stream the items of a top-level array field out of a JSON document.
+
+    Only one item is decoded at a time, so memory stays flat no matter how
+    large the scraped file grows.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            nonlocal buffer, pos, eof
+            if eof:
+                return False
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip_whitespace() -> None:
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or not fill():
+                    return
+
+        def expect(chars: str) -> str:
+            nonlocal pos
+            skip_whitespace()
+            if pos >= len(buffer) or buffer[pos] not in chars:
+                raise ValueError(f"Malformed JSON in {path}: expected one of {chars!r} at offset {pos}")
+            pos += 1
+            return buffer[pos - 1]
+
+        def decode_value() -> Any:
+            nonlocal pos
+            skip_whitespace()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A bare number at the end of the buffer may still be incomplete
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                if not fill():
+                    value, pos = decoder.raw_decode(buffer, pos)
+                    return value
+
+        expect("{")
+        skip_whitespace()
+        if pos < len(buffer) and buffer[pos] == "}":
+            return
+        while True:
+            field = decode_value()
+            expect(":")
+            if field != key:
+                decode_value()
+            else:
+                expect("[")
+                skip_whitespace()
+                if pos < len(buffer) and buffer[pos] == "]":
+                    pos += 1
+                else:
+                    while True:
+                        yield decode_value()
+                        if expect(",]") == "]":
+                            break
+            if expect(",}") == "}":
+                return
+
+
+def build_circular_text(circular: Dict[str, Any]) -> str:
+    """Flatten a scraped circular into a single text (header plus every section)."""
+    return build_header(circular) + "".join(section_texts(circular))
+
+
+def circular_identity(circular: Dict[str, Any]) -> str:
+    """Stable identity of a circular: its circular number, or its link when unnumbered."""
+    number = " ".join(str(circular.get("Circular Number", "")).split())
+    return number or circular["link"].strip()
+
+
+def circular_point_id(circular: Dict[str, Any]) -> str:
+    """Deterministic Qdrant point id, independent of the circular's position in the scrape."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, circular_identity(circular)))
+
+
+def content_hash(content_text: str) -> str:
+    """Hash of everything the vectors depend on (text, model, chunking); a change means its chunks must be rebuilt."""
+    fingerprint = f"{EMBEDDING_MODEL}\x00{CHUNK_TOKENS}\x00{CHUNK_OVERLAP}\x00{content_text}"
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+def chunk_point_id(parent_id: str, chunk_index: int) -> str:
+    """Deterministic point id of one chunk of a circular."""
+    return str(uuid.uuid5(uuid.UUID(parent_id), str(chunk_index)))
+
+
+def build_chunk_records(circular: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One record per chunk; each payload carries its parent circular's metadata.
+
+    The embedded text is the metadata header plus the chunk body, while the
+    stored text is just the body so previews and prompts skip the boilerplate.
+    """
+    parent_id = circular_point_id(circular)
+    header = build_header(circular)
+    circular_hash = content_hash(build_circular_text(circular))
+    chunks = chunk_circular(circular)
+    records = []
+    for chunk_index, chunk in enumerate(chunks):
+        records.append({
+            "id": chunk_point_id(parent_id, chunk_index),
+            "text": header + chunk,
+            "payload": {
+                "parent_id": parent_id,
+                "chunk_index": chunk_index,
+                "chunk_count": len(chunks),
+                "title": circular["Subject"],
+                "department": circular["Department"],
+                "circular_number": circular["Circular Number"],
+                "date": circular["Date Of Issue"],
+                "date_value": parse_circular_date(circular["Date Of Issue"]),
+                "meant_for": circular["Meant For"],
+                "link": circular["link"],
+                "text": chunk or header,
+                "content_hash": circular_hash
+            }
+        })
+    return records
+
+
+def with_retries(fn: Callable[[], Any], description: str) -> Any:
+    """Call fn, retrying transient API errors with exponential backoff and jitter."""
+    for attempt in range(MAX_RETRIES):
+        try:
+            return fn()
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            delay = min(60.0, 2 ** attempt) * (0.5 + random.random())
+            print(f"{description} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield lists of up to size items without materializing the whole iterable."""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Ingestor:
+    """Embeds circular chunks many-per-request and upserts them to Qdrant concurrently."""
+
+    def __init__(self, openai_client: openai.OpenAI, qdrant_client: QdrantClient,
+                 collection_name: str = COLLECTION_NAME, batch_size: int = EMBED_BATCH_SIZE,
+                 max_in_flight: int = MAX_IN_FLIGHT, quantization: str = VECTOR_QUANTIZATION,
+                 payload_fields: Optional[Iterable[str]] = None):
+        self.openai_client = openai_client
+        self.qdrant_client = qdrant_client
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.quantization = quantization
+        # None stores the full payload
+        self.payload_fields = tuple(payload_fields) if payload_fields is not None else None
+
+    @property
+    def payload_version(self) -> str:
+        """The layout version stamped on points; compact payloads are a layout of their own."""
+        if self.payload_fields is None:
+            return str(PAYLOAD_VERSION)
+        return f"{PAYLOAD_VERSION}-compact"
+
+    def ensure_collection(self, recreate: bool = False) -> None:
+        """Create the target collection and its payload indexes if they do not exist yet."""
+        quantization_config = qdrant_quantization_config(self.quantization)
+        vectors_config = models.VectorParams(
+            size=EMBEDDING_DIMENSION,
+            distance=models.Distance.COSINE,
+            # With quantized copies in RAM, the originals are only read to rescore candidates
+            on_disk=quantization_config is not None
+        )
+        if recreate:
+            self.qdrant_client.recreate_collection(
+                collection_name=self.collection_name,
+                vectors_config=vectors_config,
+                quantization_config=quantization_config
+            )
+            print(f"Recreated collection: '{self.collection_name}'")
+        else:
+            try:
+                collection = self.qdrant_client.get_collection(self.collection_name)
+            except (UnexpectedResponse, ValueError):
+                self.qdrant_client.create_collection(
+                    collection_name=self.collection_name,
+                    vectors_config=vectors_config,
+                    quantization_config=quantization_config
+                )
+                print(f"Created new collection: '{self.collection_name}'")
+            else:
+                if quantization_config is not None and collection.config.quantization_config is None:
+                    # Existing collections are quantized in place; their originals stay where they are
+                    self.qdrant_client.update_collection(
+                        collection_name=self.collection_name,
+                        quantization_config=quantization_config
+                    )
+        self.ensure_payload_indexes()
+
+    def ensure_payload_indexes(self) -> None:
+        """Index the filterable payload fields; creating an existing index is a no-op."""
+        existing = self.qdrant_client.get_collection(self.collection_name).payload_schema or {}
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            if field_name not in existing:
+                self.qdrant_client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema
+                )
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts in a single API request."""
+        response = with_retries(
+            lambda: self.openai_client.embeddings.create(input=texts, model=EMBEDDING_MODEL),
+            f"Embedding batch of {len(texts)}"
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def upsert(self, points: List[models.PointStruct]) -> None:
+        """Upsert a batch of points, retrying transient failures."""
+        with_retries(
+            lambda: self.qdrant_client.upsert(collection_name=self.collection_name, points=points),
+            f"Upserting batch of {len(points)}"
+        )
+
+    def process_batch(self, batch: List[Dict[str, Any]]) -> int:
+        """Embed and upsert one batch of prepared records."""
+        embeddings = self.embed_texts([record["text"] for record in batch])
+        self.upsert([
+            models.PointStruct(id=record["id"], vector=embedding, payload=self.point_payload(record["payload"]))
+            for record, embedding in zip(batch, embeddings)
+        ])
+        return len(batch)
+
+    def point_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """The part of a chunk payload stored with its point, stamped with the payload layout version."""
+        payload = {**payload, "payload_version": self.payload_version}
+        if self.payload_fields is None:
+            return payload
+        return {key: payload[key] for key in self.payload_fields if key in payload}
+
+    def overwrite_payloads(self, records: List[Dict[str, Any]]) -> None:
+        """Replace the payloads of already-embedded chunks in one request, keeping their vectors."""
+        if not records:
+            return
+        with_retries(
+            lambda: self.qdrant_client.batch_update_points(
+                collection_name=self.collection_name,
+                update_operations=[
+                    models.OverwritePayloadOperation(overwrite_payload=models.SetPayload(
+                        payload=self.point_payload(record["payload"]), points=[record["id"]]
+                    ))
+                    for record in records
+                ]
+            ),
+            f"Rewriting {len(records)} payloads"
+        )
+
+    def prepare(self, circulars: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Turn raw circulars into parent records holding their chunk records."""
+        for circular in circulars:
+            chunks = build_chunk_records(circular)
+            yield {
+                "id": chunks[0]["payload"]["parent_id"],
+                "content_hash": chunks[0]["payload"]["content_hash"],
+                "chunks": chunks
+            }
+
+    def existing_circulars(self) -> Dict[str, Dict[str, Any]]:
+        """Map every indexed circular id to its stored content hash, chunk point ids and payload freshness."""
+        circulars = {}
+        offset = None
+        while True:
+            points, offset = self.qdrant_client.scroll(
+                collection_name=self.collection_name,
+                limit=SCROLL_PAGE_SIZE,
+                offset=offset,
+                with_payload=["content_hash", "parent_id", "payload_version"],
+                with_vectors=False
+            )
+            for point in points:
+                payload = point.payload or {}
+                # Points written before chunking are their own parent
+                parent_id = payload.get("parent_id", str(point.id))
+                entry = circulars.setdefault(parent_id, {"content_hash": payload.get("content_hash"), "points": [],
+                                                         "payload_outdated": False})
+                entry["points"].append(str(point.id))
+                if str(payload.get("payload_version")) != self.payload_version:
+                    entry["payload_outdated"] = True
+            if offset is None:
+                return circulars
+
+    def delete(self, point_ids: List[Any]) -> None:
+        """Delete points by id in bounded batches."""
+        for batch in batched(point_ids, DELETE_BATCH_SIZE):
+            with_retries(
+                lambda: self.qdrant_client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=models.PointIdsList(points=batch)
+                ),
+                f"Deleting batch of {len(batch)}"
+            )
+
+    def reindex(self, circulars: Iterable[Dict[str, Any]], prune: bool = False) -> Dict[str, int]:
+        """Embed only new or changed circulars; optionally delete ones no longer in the inputs."""
+        return self.reindex_prepared(self.prepare(circulars), prune)
+
+    def reindex_prepared(self, prepared: Iterable[Dict[str, Any]], prune: bool = False) -> Dict[str, int]:
+        """reindex for parent records that are already chunked, e.g. CorpusStore.iter_circulars()."""
+        existing = self.existing_circulars()
+        counts = {"new": 0, "changed": 0, "unchanged": 0, "migrated": 0, "deleted": 0}
+        seen: Set[str] = set()
+        stale: List[str] = []
+        outdated: List[Dict[str, Any]] = []
+
+        def pending() -> Iterator[Dict[str, Any]]:
+            for record in prepared:
+                if record["id"] in seen:
+                    continue
+                seen.add(record["id"])
+                previous = existing.get(record["id"])
+                if previous is None:
+                    counts["new"] += 1
+                elif previous["content_hash"] != record["content_hash"]:
+                    counts["changed"] += 1
+                    current_ids = {chunk["id"] for chunk in record["chunks"]}
+                    stale.extend(point_id for point_id in previous["points"] if point_id not in current_ids)
+                elif previous["payload_outdated"]:
+                    counts["migrated"] += 1
+                    outdated.extend(record["chunks"])
+                    if len(outdated) >= self.batch_size:
+                        self.overwrite_payloads(outdated)
+                        outdated.clear()
+                    continue
+                else:
+                    counts["unchanged"] += 1
+                    continue
+                yield from record["chunks"]
+
+        self.run(pending())
+        self.overwrite_payloads(outdated)
+        # Chunks left over from a previous, longer version of a changed circular
+        self.delete(stale)
+
+        if prune:
+            removed = [parent_id for parent_id in existing if parent_id not in seen]
+            self.delete([point_id for parent_id in removed for point_id in existing[parent_id]["points"]])
+            counts["deleted"] = len(removed)
+        return counts
+
+    def run(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Run batches through a bounded pool so only max_in_flight are ever held in memory."""
+        done_count = 0
+        progress = tqdm(unit="chunk")
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            in_flight = set()
+            for batch in batched(records, self.batch_size):
+                if len(in_flight) >= self.max_in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        count = future.result()
+                        done_count += count
+                        progress.update(count)
+                in_flight.add(executor.submit(self.process_batch, batch))
+            for future in in_flight:
+                count = future.result()
+                done_count += count
+                progress.update(count)
+        progress.close()
+        return done_count
+
+
+def iter_circulars(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """Stream circulars from every input file in turn."""
+    for path in paths:
+        yield from iter_json_array(path, "circulars")
+
+
+def build_lexical_index(circulars: Iterable[Dict[str, Any]]) -> LexicalIndex:
+    """BM25 index over the same chunks, with the same point ids, as the vector collection."""
+    def records() -> Iterator[Dict[str, Any]]:
+        seen: Set[str] = set()
+        for circular in circulars:
+            for record in build_chunk_records(circular):
+                if record["id"] not in seen:
+                    seen.add(record["id"])
+                    yield record
+
+    return LexicalIndex.build(records())
+
+
+def build_corpus_store(circulars: Iterable[Dict[str, Any]], directory: str) -> CorpusWriter:
+    """Chunk the circulars once into a memory-mapped corpus store in directory."""
+    writer = CorpusWriter(directory)
+    for circular in circulars:
+        writer.add(build_chunk_records(circular))
+    writer.close()
+    return writer
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Embed scraped RBI circulars and index them in Qdrant.")
+    parser.add_argument("inputs", nargs="+", help="Scraper output files (trimmed_data.txt, rbi_circulars.json)")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Texts per embeddings request")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="Concurrent embed/upsert batches")
+    parser.add_argument("--recreate", action="store_true", help="Drop and recreate the collection first")
+    parser.add_argument("--prune", action="store_true",
+                        help="Delete indexed circulars that are missing from the inputs")
+    parser.add_argument("--quantization", choices=("none", "int8", "binary"), default=VECTOR_QUANTIZATION,
+                        help="Quantize the collection's vectors (applied when it is created, or to an unquantized one)")
+    parser.add_argument("--lexical-index", metavar="DIR",
+                        help="Also rebuild the BM25 index for hybrid search in DIR")
+    parser.add_argument("--corpus-store", metavar="DIR", nargs="?", const=CORPUS_STORE_PATH,
+                        help="Chunk the inputs once into a memory-mapped corpus store (default "
+                             f"{CORPUS_STORE_PATH}) and index from it")
+    parser.add_argument("--compact-payloads", action="store_true",
+                        help="Store only ids and filter fields in Qdrant; the app reads the rest from the corpus store")
+    args = parser.parse_args(argv)
+    if args.compact_payloads and not args.corpus_store:
+        parser.error("--compact-payloads needs --corpus-store; the app reads chunk texts from the store")
+
+    ingestor = Ingestor(
+        openai.OpenAI(api_key=OPENAI_API_KEY),
+        QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY),
+        collection_name=args.collection,
+        batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight,
+        quantization=args.quantization,
+        payload_fields=COMPACT_PAYLOAD_FIELDS if args.compact_payloads else None,
+    )
+    ingestor.ensure_collection(recreate=args.recreate)
+
+    store = None
+    if args.corpus_store:
+        writer = build_corpus_store(iter_circulars(args.inputs), args.corpus_store)
+        print(f"Built corpus store of {len(writer.circular_ids)} circulars, "
+              f"{len(writer.chunk_ids)} chunks in {args.corpus_store}")
+        store = CorpusStore.load(args.corpus_store)
+
+    start = time.perf_counter()
+    if store is not None:
+        counts = ingestor.reindex_prepared(store.iter_circulars(), prune=args.prune)
+    else:
+        counts = ingestor.reindex(iter_circulars(args.inputs), prune=args.prune)
+    print(
+        f"Re-indexed '{args.collection}' in {time.perf_counter() - start:.1f}s: "
+        f"{counts['new']} new, {counts['changed']} changed, {counts['unchanged']} unchanged, "
+        f"{counts['migrated']} payloads rewritten, {counts['deleted']} deleted"
+    )
+
+    index_changed = counts["new"] or counts["changed"] or counts["migrated"] or counts["deleted"]
+    lexical_index_path = args.lexical_index
+    if lexical_index_path is None and index_changed and os.path.exists(LEXICAL_INDEX_PATH):
+        # Identifier queries are answered from the lexical index alone, so it must not fall behind
+        print(f"Collection changed; rebuilding the lexical index in {LEXICAL_INDEX_PATH}")
+        lexical_index_path = LEXICAL_INDEX_PATH
+    if lexical_index_path:
+        if store is not None:
+            index = LexicalIndex.build(store.iter_chunk_records())
+        else:
+            index = build_lexical_index(iter_circulars(args.inputs))
+        index.save(lexical_index_path)
+        print(f"Built lexical index over {len(index)} chunks in {lexical_index_path}")
+
+    if index_changed:
+        # Cached answers may cite circulars that changed; running apps also reload the lexical index
+        bump_index_version(ingestor.qdrant_client, args.collection)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import math
+from collections import defaultdict, Counter
+from typing import List, Dict, Any, Iterable, Optional
+
+import numpy as np
+
+from vector_store import top_k
+
+# Configuration
+LEXICAL_INDEX_PATH = os.environ.get("LEXICAL_INDEX_PATH", ".cache/lexical_index")
+BM25_K1 = float(os.environ.get("BM25_K1", "1.2"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+
+POSTINGS_FILE = "postings.npz"
+VOCABULARY_FILE = "vocabulary.json"
+DOCUMENTS_FILE = "documents.jsonl"
+
+_WORD_PATTERN = re.compile(r"[a-z]+|\d+")
+# RBI reference codes such as DOR.CRE.REC.62 or DPSS.CO.PD.No.123
+_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z]{2,}(?:\.[A-Za-z]+)+\.\d+")
+
+
+def identifier_tokens(text: str) -> List[str]:
+    """Reference-code tokens in text, normalized to lower case."""
+    return [f"id:{match.lower()}" for match in _IDENTIFIER_PATTERN.findall(text)]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lexical tokens: lower-cased words and digit runs, plus whole reference codes."""
+    return _WORD_PATTERN.findall(text.lower()) + identifier_tokens(text)
+
+
+def is_identifier_query(query: str, max_other_words: int = 3) -> bool:
+    """True when the query is essentially a circular reference lookup."""
+    if not identifier_tokens(query):
+        return False
+    remainder = _IDENTIFIER_PATTERN.sub(" ", query)
+    return len(remainder.split()) <= max_other_words
+
+
+class LexicalIndex:
+    """BM25 over chunk texts, stored as a compact inverted index of numpy postings arrays."""
+
+    def __init__(self, vocabulary: Dict[str, int], offsets: np.ndarray, doc_ids: np.ndarray,
+                 term_freqs: np.ndarray, doc_lengths: np.ndarray, ids: List[Any], payloads: List[Dict[str, Any]]):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.ids = ids
+        self.payloads = payloads
+        self.average_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, records: Iterable[Dict[str, Any]]) -> "LexicalIndex":
+        """Build an index from records with an id, the indexed text and a payload."""
+        postings = defaultdict(list)
+        ids, payloads, lengths = [], [], []
+        for doc, record in enumerate(records):
+            counts = Counter(tokenize(record["text"]))
+            for term, count in counts.items():
+                postings[term].append((doc, count))
+            ids.append(record["id"])
+            payloads.append(record["payload"])
+            lengths.append(sum(counts.values()))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[term])
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        term_freqs = np.empty(offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(terms):
+            entries = np.asarray(postings[term], dtype=np.int64)
+            doc_ids[offsets[i]:offsets[i + 1]] = entries[:, 0]
+            term_freqs[offsets[i]:offsets[i + 1]] = np.minimum(entries[:, 1], np.iinfo(np.uint16).max)
+        vocabulary = {term: i for i, term in enumerate(terms)}
+        return cls(vocabulary, offsets, doc_ids, term_freqs, np.asarray(lengths, dtype=np.int32), ids, payloads)
+
+    def save(self, directory: str = LEXICAL_INDEX_PATH) -> None:
+        """Write the index to a directory."""
+        os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(
+            os.path.join(directory, POSTINGS_FILE),
+            offsets=self.offsets, doc_ids=self.doc_ids, term_freqs=self.term_freqs, doc_lengths=self.doc_lengths
+        )
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(os.path.join(directory, VOCABULARY_FILE), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        with open(os.path.join(directory, DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+            for point_id, payload in zip(self.ids, self.payloads):
+                f.write(json.dumps({"id": point_id, "payload": payload}, ensure_ascii=False) + "\n")
+
+    @classmethod
+    def load(cls, directory: str = LEXICAL_INDEX_PATH) -> "LexicalIndex":
+        """Load an index written by save."""
+        arrays = np.load(os.path.join(directory, POSTINGS_FILE))
+        with open(os.path.join(directory, VOCABULARY_FILE), "r", encoding="utf-8") as f:
+            vocabulary = {term: i for i, term in enumerate(json.load(f))}
+        ids, payloads = [], []
+        with open(os.path.join(directory, DOCUMENTS_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                ids.append(record["id"])
+                payloads.append(record["payload"])
+        return cls(vocabulary, arrays["offsets"], arrays["doc_ids"], arrays["term_freqs"],
+                   arrays["doc_lengths"], ids, payloads)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for the query."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        if not len(self.ids):
+            return scores
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / self.average_length)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end].astype(np.float32)
+            idf = math.log(1 + (len(self.ids) - len(docs) + 0.5) / (len(docs) + 0.5))
+            np.add.at(scores, docs, idf * tf * (BM25_K1 + 1) / (tf + length_norm[docs]))
+        return scores
+
+    def search(self, query: str, limit: int, rows: Optional[np.ndarray] = None) -> List[tuple]:
+        """Return (row, score) pairs for the limit best-matching documents, best first."""
+        scores = self.scores(query)
+        if rows is not None:
+            candidates = rows[scores[rows] > 0]
+        else:
+            candidates = np.flatnonzero(scores > 0)
+        best = top_k(scores[candidates], limit)
+        return [(int(candidates[i]), float(scores[candidates[i]])) for i in best]
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
+
+# Configuration - TRACE_LOG is "" (off), "-" (stdout) or a JSONL file path
+TRACE_LOG = os.environ.get("TRACE_LOG", "")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 16000)
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+_registry = []
+_span_listeners = []
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+_trace_log_lock = threading.Lock()
+
+
+def format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter in the Prometheus text exposition format."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text exposition format."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = format_labels(self.labelnames, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = Histogram("rag_request_seconds", "End-to-end latency of a RAG request.", ("path",))
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Latency of one RAG pipeline stage.", ("stage",))
+SEARCH_TOP_SCORE = Histogram("rag_search_top_score", "Score of the best hit returned by a search.",
+                             ("backend",), SCORE_BUCKETS)
+PROMPT_TOKENS = Histogram("rag_prompt_tokens", "Locally counted prompt tokens per generation request.",
+                          buckets=TOKEN_BUCKETS)
+TOKENS = Counter("rag_tokens_total", "OpenAI tokens used, by kind.", ("kind",))
+CACHE_LOOKUPS = Counter("rag_cache_lookups_total", "Cache lookups, by cache and outcome.", ("cache", "result"))
+
+
+class Trace:
+    """Spans recorded for one request, logged as a single JSON line when TRACE_LOG is set."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.spans = []
+        self.attrs = {}
+        self._token = None
+
+    def add_span(self, stage: str, seconds: float, attrs: Dict[str, Any]) -> None:
+        self.spans.append({"stage": stage, "ms": round(seconds * 1000, 2), **attrs})
+
+    def finish(self) -> None:
+        """Record the request and stop later spans in this context from attaching to it."""
+        if self._token is not None:
+            try:
+                _current_trace.reset(self._token)
+            except ValueError:  # Finished from another context, e.g. a later step of a generator
+                if _current_trace.get() is self:
+                    _current_trace.set(None)
+            self._token = None
+        seconds = time.perf_counter() - self.start
+        REQUEST_SECONDS.observe(seconds, path=self.path)
+        if TRACE_LOG:
+            write_trace({"trace_id": self.trace_id, "path": self.path, "ms": round(seconds * 1000, 2),
+                         **self.attrs, "spans": self.spans})
+
+
+def write_trace(record: Dict[str, Any]) -> None:
+    line = json.dumps(record, default=str)
+    if TRACE_LOG == "-":
+        print(line)
+        return
+    with _trace_log_lock, open(TRACE_LOG, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def start_trace(path: str) -> Trace:
+    """Begin a request trace that later spans in this context attach to; call finish() when done."""
+    trace = Trace(path)
+    trace._token = _current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def trace_request(path: str) -> Iterator[Trace]:
+    """Trace one request for the duration of the block."""
+    trace = start_trace(path)
+    try:
+        yield trace
+    finally:
+        trace.finish()
+
+
+def annotate(**attrs) -> None:
+    """Attach request-level attributes (cache hits, result counts) to the current trace."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+@contextmanager
+def span(stage: str, **attrs) -> Iterator[Dict[str, Any]]:
+    """Time a pipeline stage; the yielded dict collects attributes for the trace log."""
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(stage, seconds, attrs)
+        for listener in _span_listeners:
+            listener(stage, seconds, attrs)
+
+
+def add_span_listener(listener: Callable[[str, float, Dict[str, Any]], None]) -> None:
+    """Call listener(stage, seconds, attrs) for every finished span, e.g. to collect raw samples."""
+    _span_listeners.append(listener)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_usage(usage, attrs: Optional[Dict[str, Any]] = None) -> None:
+    """Count the prompt/completion tokens of an OpenAI usage object."""
+    if usage is None:
+        return
+    TOKENS.inc(usage.prompt_tokens, kind="prompt")
+    TOKENS.inc(usage.completion_tokens, kind="completion")
+    if attrs is not None:
+        attrs["prompt_tokens"] = usage.prompt_tokens
+        attrs["completion_tokens"] = usage.completion_tokens
+
+
+def record_prompt_tokens(tokens: int) -> None:
+    """Record the size of a packed prompt."""
+    PROMPT_TOKENS.observe(tokens)
+    annotate(prompt_tokens=tokens)
+
+
+def record_search(backend: str, hits: List[Any], attrs: Optional[Dict[str, Any]] = None) -> None:
+    """Record the hit count and best score of a search."""
+    top_score = max((getattr(hit, "score", 0.0) for hit in hits), default=None)
+    if top_score is not None:
+        SEARCH_TOP_SCORE.observe(top_score, backend=backend)
+    if attrs is not None:
+        attrs["hits"] = len(hits)
+        attrs["top_score"] = None if top_score is None else round(float(top_score), 4)
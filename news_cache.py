@@ -0,0 +1,92 @@
+import time
+import threading
+from typing import Any, Callable, Optional
+
+
+class RefreshingCache:
+    """Process-wide cache of one expensive value, rebuilt on a schedule by a background thread.
+
+    Readers get the cached value immediately. Once it is older than ttl,
+    stale_while_revalidate returns the stale value while a single
+    background rebuild runs; without it the reader waits for the rebuild.
+    """
+
+    def __init__(self, loader: Callable[[], Any], ttl: float, refresh_interval: Optional[float] = None,
+                 stale_while_revalidate: bool = True, name: str = "cache"):
+        self.loader = loader
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.stale_while_revalidate = stale_while_revalidate
+        self.name = name
+        self.value = None
+        self.loaded_at = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._thread = None
+
+    def _load(self) -> Any:
+        requested = time.time()
+        # Only one rebuild at a time; callers that queued behind it reuse its result
+        with self._load_lock:
+            if self.loaded_at is not None and self.loaded_at >= requested:
+                return self.value
+            try:
+                value = self.loader()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Refreshing {self.name} failed: {str(e)}")
+                return self.value
+            with self._lock:
+                self.value = value
+                self.loaded_at = time.time()
+                self.last_error = None
+            return value
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self._load()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name=f"{self.name}-refresh", daemon=True).start()
+
+    def age(self) -> Optional[float]:
+        """Seconds since the value was built, or None if it never was."""
+        return None if self.loaded_at is None else time.time() - self.loaded_at
+
+    def get(self, block: bool = True) -> Any:
+        """The cached value, building it first if there is none and block is set."""
+        age = self.age()
+        if age is None:
+            return self._load() if block else None
+        if age > self.ttl:
+            if self.stale_while_revalidate:
+                self._refresh_in_background()
+            else:
+                return self._load()
+        return self.value
+
+    def refresh(self) -> Any:
+        """Rebuild the value now."""
+        return self._load()
+
+    def start(self) -> "RefreshingCache":
+        """Start the scheduled background refresher (idempotent)."""
+        if self.refresh_interval and self._thread is None:
+            def loop():
+                while True:
+                    self._load()
+                    time.sleep(self.refresh_interval)
+
+            self._thread = threading.Thread(target=loop, name=f"{self.name}-scheduler", daemon=True)
+            self._thread.start()
+        return self
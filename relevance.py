@@ -0,0 +1,86 @@
+import os
+import re
+from functools import lru_cache
+from typing import List, Optional, Set, Tuple
+
+# Configuration
+RELEVANCE_ACCEPT = float(os.environ.get("RELEVANCE_ACCEPT", "0.25"))
+RELEVANCE_REJECT_MIN_TERMS = int(os.environ.get("RELEVANCE_REJECT_MIN_TERMS", "3"))
+
+# Payments vocabulary; it keeps on-domain queries away from the reject path but never accepts on its own
+DOMAIN_VOCABULARY = """
+npci upi rupay imps nach aeps bbps bharat billpay fastag netc bhim nfs cts ecs neft rtgs
+payment payments pay settlement clearing transaction transfer remittance wallet card cards debit credit
+rbi reserve bank banks banking nbfc nbfcs cooperative ucb fintech digital lending loan loans
+circular circulars regulation regulatory guideline guidelines compliance kyc aml fraud cyber security
+interest rate repo monetary policy inflation rupee currency forex exchange market markets
+merchant qr mandate autopay interoperability limit limits charges mdr
+"""
+
+STOPWORDS = set("""
+a an and are as at be by can could did do does for from had has have how i in is it its
+latest me my new news of on or please recent show should tell than that the their them then
+there these they this to update updates was what when where which who why will with would you your
+about any all also give list more most some
+""".split())
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def stem(word: str) -> str:
+    """Very light stemming so plurals match their singular."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def content_terms(text: str) -> Set[str]:
+    """Stemmed, stopword-free terms of text."""
+    return {stem(word) for word in _WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS}
+
+
+class RelevanceGate:
+    """Local keyword gate that decides query relevance without an LLM call.
+
+    A query is accepted only when enough of its terms overlap the user's
+    own profile (department and interests). It is rejected when a
+    substantive query shares no term with the profile or the payments
+    domain vocabulary. Anything else, including queries that only match
+    the domain vocabulary, is left undecided so the caller can fall back
+    to the LLM.
+    """
+
+    def __init__(self, profile_texts: List[str], domain_texts: List[str] = (), accept: float = RELEVANCE_ACCEPT,
+                 reject_min_terms: int = RELEVANCE_REJECT_MIN_TERMS):
+        self.profile = set()
+        for text in profile_texts:
+            self.profile |= content_terms(text)
+        self.domain = set()
+        for text in domain_texts:
+            self.domain |= content_terms(text)
+        self.accept = accept
+        self.reject_min_terms = reject_min_terms
+
+    def score(self, query: str) -> Tuple[float, float, int]:
+        """Fractions of the query's terms found in the profile and in the domain vocabulary, and the term count."""
+        terms = content_terms(query)
+        if not terms:
+            return 0.0, 0.0, 0
+        return len(terms & self.profile) / len(terms), len(terms & self.domain) / len(terms), len(terms)
+
+    def decide(self, query: str) -> Optional[bool]:
+        """True or False when confident, None for borderline queries."""
+        profile_overlap, domain_overlap, term_count = self.score(query)
+        if profile_overlap >= self.accept:
+            return True
+        if profile_overlap == 0.0 and domain_overlap == 0.0 and term_count >= self.reject_min_terms:
+            return False
+        return None
+
+
+@lru_cache(maxsize=256)
+def get_relevance_gate(department: str, interests: Tuple[str, ...]) -> RelevanceGate:
+    """Gate for one user profile, built once per distinct profile."""
+    return RelevanceGate([department, " ".join(interests)], [DOMAIN_VOCABULARY])
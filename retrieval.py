@@ -0,0 +1,339 @@
+import os
+from datetime import datetime
+from collections import namedtuple
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from qdrant_client.http import models
+
+from vector_store import VECTOR_QUANTIZATION, RESCORE_OVERSAMPLING
+
+# Configuration
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "qdrant")
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+RRF_K = int(os.environ.get("RRF_K", "60"))
+QDRANT_PREFER_GRPC = os.environ.get("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+
+# Payload fields the results view and prompt actually use; the stored content_hash etc. stay server-side
+RESULT_PAYLOAD_FIELDS = [
+    "parent_id", "chunk_index", "title", "department", "circular_number", "date", "meant_for", "link", "text"
+]
+
+# Same shape as a Qdrant ScoredPoint, so callers need not care which backend answered
+Hit = namedtuple("Hit", ["id", "score", "payload"])
+
+DATE_FORMATS = ("%d.%m.%Y", "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y")
+
+
+def parse_circular_date(value: str) -> Optional[int]:
+    """Parse an RBI date such as "24.2.2025" (or an ISO date) into a sortable YYYYMMDD integer."""
+    value = (value or "").strip()
+    for date_format in DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        return parsed.year * 10000 + parsed.month * 100 + parsed.day
+    return None
+
+
+def build_filters(departments: Optional[List[str]] = None, date_from: str = "", date_to: str = "",
+                  meant_for: str = "") -> Optional[Dict[str, Any]]:
+    """Validate UI/API filter inputs into the filter dict the backends understand."""
+    filters = {}
+    if departments:
+        filters["departments"] = list(departments)
+    for key, value in (("date_from", date_from), ("date_to", date_to)):
+        if value and value.strip():
+            parsed = parse_circular_date(value)
+            if parsed is None:
+                raise ValueError(f"Could not parse {key.replace('_', ' ')} {value!r}; use YYYY-MM-DD")
+            filters[key] = parsed
+    if meant_for and meant_for.strip():
+        filters["meant_for"] = meant_for.strip()
+    return filters or None
+
+
+def build_qdrant_filter(filters: Optional[Dict[str, Any]]) -> Optional[models.Filter]:
+    """Translate a filter dict into a server-side Qdrant filter over the indexed payload fields."""
+    if not filters:
+        return None
+    conditions = []
+    if filters.get("departments"):
+        conditions.append(models.FieldCondition(
+            key="department",
+            match=models.MatchAny(any=filters["departments"])
+        ))
+    if filters.get("date_from") or filters.get("date_to"):
+        conditions.append(models.FieldCondition(
+            key="date_value",
+            range=models.Range(gte=filters.get("date_from"), lte=filters.get("date_to"))
+        ))
+    if filters.get("meant_for"):
+        conditions.append(models.FieldCondition(
+            key="meant_for",
+            match=models.MatchText(text=filters["meant_for"])
+        ))
+    return models.Filter(must=conditions)
+
+
+def qdrant_quantization_config(kind: str = VECTOR_QUANTIZATION):
+    """Collection quantization for "int8" or "binary", or None to store float32 only."""
+    if kind == "int8":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+        ))
+    if kind == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown VECTOR_QUANTIZATION: {kind!r} (expected 'none', 'int8' or 'binary')")
+
+
+def qdrant_search_params(kind: str = VECTOR_QUANTIZATION) -> Optional[models.SearchParams]:
+    """Search on the quantized vectors, then rescore the oversampled candidates with the originals."""
+    if kind == "none":
+        return None
+    return models.SearchParams(quantization=models.QuantizationSearchParams(
+        rescore=True, oversampling=RESCORE_OVERSAMPLING
+    ))
+
+
+class QdrantBackend:
+    """Vector search against a Qdrant collection.
+
+    Searches use the search/search_batch calls of the pinned qdrant-client.
+    Errors propagate to the caller rather than turning into empty results.
+    With a corpus store, searches fetch ids and content hashes only and
+    payloads are read from the store; hits the store holds an older version
+    of are fetched from Qdrant instead. A store rebuilt on disk is picked up
+    on the next search.
+    """
+
+    def __init__(self, qdrant_client, async_qdrant_client, collection_name: str,
+                 payload_fields: Optional[List[str]] = RESULT_PAYLOAD_FIELDS, corpus_store=None):
+        self.qdrant_client = qdrant_client
+        self.async_qdrant_client = async_qdrant_client
+        self.collection_name = collection_name
+        self.payload_fields = payload_fields
+        self.corpus_store = corpus_store
+        if corpus_store is not None:
+            # The hash is what tells a current store row from a stale one
+            self.with_payload = ["content_hash"]
+        else:
+            # None fetches the whole payload
+            self.with_payload = list(payload_fields) if payload_fields is not None else True
+        self.search_params = qdrant_search_params()
+
+    def search(self, query_vector: List[float], limit: int, filters: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """Return the limit nearest points to query_vector that match filters."""
+        points = self.qdrant_client.search(
+            collection_name=self.collection_name,
+            query_vector=query_vector,
+            query_filter=build_qdrant_filter(filters),
+            limit=limit,
+            with_payload=self.with_payload,
+            search_params=self.search_params
+        )
+        return self.hydrate(points)
+
+    async def search_async(self, query_vector: List[float], limit: int,
+                           filters: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """Async variant of search."""
+        points = await self.async_qdrant_client.search(
+            collection_name=self.collection_name,
+            query_vector=query_vector,
+            query_filter=build_qdrant_filter(filters),
+            limit=limit,
+            with_payload=self.with_payload,
+            search_params=self.search_params
+        )
+        return await self.hydrate_async(points)
+
+    async def search_batch_async(self, query_vectors: List[List[float]], limit: int,
+                                 filters: Optional[Dict[str, Any]] = None) -> List[List[Any]]:
+        """Search for several vectors in one round trip; one hit list per vector."""
+        query_filter = build_qdrant_filter(filters)
+        results = await self.async_qdrant_client.search_batch(
+            collection_name=self.collection_name,
+            requests=[
+                models.SearchRequest(vector=vector, filter=query_filter, limit=limit,
+                                     with_payload=self.with_payload, params=self.search_params)
+                for vector in query_vectors
+            ]
+        )
+        return [await self.hydrate_async(points) for points in results]
+
+    def hydrate(self, points: List[Any]) -> List[Any]:
+        """Attach corpus-store payloads to id-only hits; ids missing from or stale in the store are fetched."""
+        if self.corpus_store is None:
+            return require_text(points)
+        self.corpus_store = self.corpus_store.latest()
+        payloads, missing = store_payloads(self.corpus_store, points)
+        if missing:
+            fetched = self.qdrant_client.retrieve(self.collection_name, ids=missing,
+                                                  with_payload=self.payload_fields or True)
+            payloads.update((str(record.id), record.payload) for record in require_text(fetched))
+        return [Hit(point.id, point.score, payloads.get(str(point.id))) for point in points]
+
+    async def hydrate_async(self, points: List[Any]) -> List[Any]:
+        """Async variant of hydrate."""
+        if self.corpus_store is None:
+            return require_text(points)
+        self.corpus_store = self.corpus_store.latest()
+        payloads, missing = store_payloads(self.corpus_store, points)
+        if missing:
+            fetched = await self.async_qdrant_client.retrieve(self.collection_name, ids=missing,
+                                                              with_payload=self.payload_fields or True)
+            payloads.update((str(record.id), record.payload) for record in require_text(fetched))
+        return [Hit(point.id, point.score, payloads.get(str(point.id))) for point in points]
+
+
+def store_payloads(corpus_store, points: List[Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Payloads of the hits from the corpus store, and the ids it does not hold a current copy of."""
+    payloads = {}
+    for point in points:
+        payload = corpus_store.payload(point.id)
+        # A reindex without --corpus-store leaves the store behind the collection
+        if payload is not None and payload["content_hash"] != (point.payload or {}).get("content_hash"):
+            payload = None
+        payloads[str(point.id)] = payload
+    return payloads, [point_id for point_id, payload in payloads.items() if payload is None]
+
+
+def require_text(points: List[Any]) -> List[Any]:
+    """Return points, raising if any payload lacks its text because the collection was ingested compact."""
+    for point in points:
+        if point.payload is not None and "text" not in point.payload:
+            raise RuntimeError(
+                f"Point {point.id} has a compact payload with no text. Rebuild the corpus store with "
+                "`python ingest.py --corpus-store` and point CORPUS_STORE_PATH at it."
+            )
+    return points
+
+
+class PayloadColumns:
+    """Columnar copy of the filterable payload fields for vectorized filtering of in-process indexes."""
+
+    def __init__(self, payloads: List[Dict[str, Any]]):
+        self.departments = np.array([p.get("department", "") for p in payloads], dtype=object)
+        self.date_values = np.array([p.get("date_value") or 0 for p in payloads], dtype=np.int64)
+        self.meant_for = [p.get("meant_for", "").lower() for p in payloads]
+
+    def filter_rows(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Rows matching filters, or None when nothing is filtered."""
+        if not filters:
+            return None
+        mask = np.ones(len(self.departments), dtype=bool)
+        if filters.get("departments"):
+            mask &= np.isin(self.departments, filters["departments"])
+        if filters.get("date_from"):
+            mask &= self.date_values >= filters["date_from"]
+        if filters.get("date_to"):
+            mask &= (self.date_values <= filters["date_to"]) & (self.date_values > 0)
+        if filters.get("meant_for"):
+            needle = filters["meant_for"].lower()
+            mask &= np.fromiter((needle in text for text in self.meant_for), dtype=bool, count=len(self.meant_for))
+        return np.flatnonzero(mask)
+
+
+class LocalBackend:
+    """Vector search against an in-process, memory-mapped LocalVectorIndex.
+
+    An index exported from a compact-payload collection holds no texts; with
+    a corpus store its hits are filled in from the store as QdrantBackend does.
+    """
+
+    def __init__(self, index, corpus_store=None):
+        self.index = index
+        self.columns = PayloadColumns(index.payloads)
+        self.corpus_store = corpus_store
+
+    def hits(self, matches: List[Tuple[int, float]]) -> List[Hit]:
+        """Hits for (row, score) matches, with payloads from the corpus store where it is current."""
+        hits = [Hit(self.index.ids[row], score, self.index.payloads[row]) for row, score in matches]
+        if self.corpus_store is None:
+            return require_text(hits)
+        self.corpus_store = self.corpus_store.latest()
+        payloads, missing = store_payloads(self.corpus_store, hits)
+        missing = set(missing)
+        require_text([hit for hit in hits if str(hit.id) in missing])
+        return [hit if str(hit.id) in missing else hit._replace(payload=payloads[str(hit.id)]) for hit in hits]
+
+    def search(self, query_vector: List[float], limit: int, filters: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """Return the limit nearest points to query_vector that match filters."""
+        return self.hits(self.index.search(query_vector, limit, rows=self.columns.filter_rows(filters)))
+
+    async def search_async(self, query_vector: List[float], limit: int,
+                           filters: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """Async variant of search; a local search is sub-millisecond, so it runs inline."""
+        return self.search(query_vector, limit, filters)
+
+    def search_batch(self, query_vectors: List[List[float]], limit: int,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[Hit]]:
+        """Search for several vectors with one vectorized pass; one hit list per vector."""
+        matches = self.index.search_batch(query_vectors, limit, rows=self.columns.filter_rows(filters))
+        return [self.hits(query_matches) for query_matches in matches]
+
+    async def search_batch_async(self, query_vectors: List[List[float]], limit: int,
+                                 filters: Optional[Dict[str, Any]] = None) -> List[List[Hit]]:
+        """Async variant of search_batch."""
+        return self.search_batch(query_vectors, limit, filters)
+
+
+class LexicalBackend:
+    """BM25 search over the lexical index built at ingest time."""
+
+    def __init__(self, index):
+        self.index = index
+        self.columns = PayloadColumns(index.payloads)
+
+    def search(self, query: str, limit: int, filters: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """Return the limit best lexical matches, scores scaled so the best hit is 1.0."""
+        matches = self.index.search(query, limit, rows=self.columns.filter_rows(filters))
+        if not matches:
+            return []
+        best_score = matches[0][1]
+        return [Hit(self.index.ids[row], score / best_score, self.index.payloads[row]) for row, score in matches]
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Any]], limit: int, k: int = RRF_K) -> List[Hit]:
+    """Merge ranked hit lists by reciprocal rank, scaled so a hit ranked first everywhere scores 1.0."""
+    fused = {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits):
+            key = str(hit.id)
+            if key not in fused:
+                fused[key] = [0.0, hit]
+            fused[key][0] += 1.0 / (k + rank + 1)
+    max_score = len(result_lists) / (k + 1)
+    ranked = sorted(fused.values(), key=lambda entry: entry[0], reverse=True)[:limit]
+    return [Hit(hit.id, score / max_score, hit.payload) for score, hit in ranked]
+
+
+def load_lexical_backend() -> Optional[LexicalBackend]:
+    """The lexical backend, or None when hybrid search is off or no index has been built."""
+    from lexical_index import LexicalIndex, LEXICAL_INDEX_PATH
+
+    if not HYBRID_SEARCH:
+        return None
+    if not os.path.exists(LEXICAL_INDEX_PATH):
+        print(f"No lexical index at {LEXICAL_INDEX_PATH}; using dense retrieval only")
+        return None
+    return LexicalBackend(LexicalIndex.load(LEXICAL_INDEX_PATH))
+
+
+def create_backend(qdrant_client, async_qdrant_client, collection_name: str, backend: str = RETRIEVAL_BACKEND,
+                   corpus_store=None):
+    """Build the retrieval backend selected by RETRIEVAL_BACKEND ("qdrant" or "local").
+
+    Given a corpus store, hits read their payloads from it wherever it holds the current chunk.
+    """
+    if backend == "local":
+        from vector_store import LocalVectorIndex
+
+        return LocalBackend(LocalVectorIndex.load(), corpus_store=corpus_store)
+    if backend == "qdrant":
+        return QdrantBackend(qdrant_client, async_qdrant_client, collection_name, corpus_store=corpus_store)
+    raise ValueError(f"Unknown RETRIEVAL_BACKEND: {backend!r} (expected 'qdrant' or 'local')")
@@ -0,0 +1,44 @@
+from answer_cache import SemanticAnswerCache
+
+
+def test_similar_query_with_the_same_circulars_hits():
+    cache = SemanticAnswerCache(max_entries=4, ttl=60, max_distance=0.05)
+    cache.store([1.0, 0.0, 0.0], ["a", "b"], "answer", "<p>html</p>")
+    assert cache.lookup([0.99, 0.05, 0.0], ["a", "b"]) == ("answer", "<p>html</p>")
+    assert cache.stats() == {"hits": 1, "misses": 0, "entries": 1}
+
+
+def test_different_circulars_or_distant_queries_miss():
+    cache = SemanticAnswerCache(max_entries=4, ttl=60, max_distance=0.05)
+    cache.store([1.0, 0.0], ["a", "b"], "answer", "html")
+    assert cache.lookup([1.0, 0.0], ["b", "a"]) is None
+    assert cache.lookup([0.0, 1.0], ["a", "b"]) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticAnswerCache(max_entries=2, ttl=60, max_distance=0.01)
+    cache.store([1.0, 0.0, 0.0], ["a"], "first", "")
+    cache.store([0.0, 1.0, 0.0], ["b"], "second", "")
+    assert cache.lookup([1.0, 0.0, 0.0], ["a"]) is not None
+    cache.store([0.0, 0.0, 1.0], ["c"], "third", "")
+    assert cache.lookup([0.0, 1.0, 0.0], ["b"]) is None
+    assert cache.lookup([1.0, 0.0, 0.0], ["a"])[0] == "first"
+
+
+def test_expired_entries_miss(monkeypatch):
+    cache = SemanticAnswerCache(max_entries=2, ttl=10, max_distance=0.01)
+    cache.store([1.0, 0.0], ["a"], "answer", "")
+    import answer_cache
+    now = answer_cache.time.time()
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now + 11)
+    assert cache.lookup([1.0, 0.0], ["a"]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_a_new_index_version_clears_the_cache():
+    version = ["v1"]
+    cache = SemanticAnswerCache(max_entries=2, ttl=60, max_distance=0.01, version_source=lambda: version[0])
+    cache.store([1.0, 0.0], ["a"], "answer", "")
+    assert cache.lookup([1.0, 0.0], ["a"]) is not None
+    version[0] = "v2"
+    assert cache.lookup([1.0, 0.0], ["a"]) is None
@@ -0,0 +1,35 @@
+from chunking import chunk_circular, count_tokens
+
+
+def circular(*sections):
+    return {"details": {"circular": {"contentSections": [
+        {"title": title, "content": content} for title, content in sections
+    ]}}}
+
+
+def test_short_sections_are_packed_together():
+    chunks = chunk_circular(circular(("One", "alpha beta"), ("Two", "gamma delta")), size=50, overlap=5)
+    assert len(chunks) == 1
+    assert "Section: One" in chunks[0] and "Section: Two" in chunks[0]
+
+
+def test_chunks_respect_the_size_and_keep_section_boundaries():
+    sections = [(f"S{i}", " ".join(f"w{i}x{j}" for j in range(20))) for i in range(6)]
+    chunks = chunk_circular(circular(*sections), size=50, overlap=5)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+    # Sections that fit are never split across chunks
+    assert all(chunk.startswith("Section: ") for chunk in chunks)
+
+
+def test_long_sections_become_overlapping_windows():
+    words = [f"word{i}" for i in range(300)]
+    chunks = chunk_circular(circular(("Long", " ".join(words))), size=100, overlap=20)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 100 for chunk in chunks)
+    first, second = chunks[0].split(), chunks[1].split()
+    assert first[-1] in second
+
+
+def test_empty_circular_gets_one_header_only_chunk():
+    assert chunk_circular({}) == [""]
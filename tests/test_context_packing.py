@@ -0,0 +1,45 @@
+from context_packing import pack_context
+
+
+def doc(number, *passages):
+    return {
+        "title": f"Circular {number}",
+        "circular_number": f"RBI/{number}",
+        "department": "Department of Regulation",
+        "date": "01.01.2025",
+        "passages": [{"chunk_index": i, "text": text, "score": score} for i, (text, score) in enumerate(passages)],
+    }
+
+
+def sentence(tag, words=30):
+    return " ".join(f"{tag}{i}" for i in range(words)) + "."
+
+
+def test_near_duplicate_passages_are_dropped():
+    text = sentence("kyc")
+    context, stats = pack_context([doc(1, (text, 0.9)), doc(2, (text, 0.8))], budget=1000)
+    assert stats["duplicates_dropped"] == 1
+    assert stats["documents_used"] == 1
+    assert context.count(text) == 1
+
+
+def test_budget_is_respected_and_the_best_passages_win():
+    docs = [doc(1, (sentence("low", 200), 0.1)), doc(2, (sentence("high", 200), 0.9))]
+    context, stats = pack_context(docs, budget=300)
+    assert stats["context_tokens"] <= 300
+    assert "high0" in context
+    assert stats["truncated"] == 1
+
+
+def test_passages_render_in_document_order_per_circular():
+    docs = [doc(1, (sentence("a"), 0.2), (sentence("b"), 0.9))]
+    context, stats = pack_context(docs, budget=1000)
+    assert stats["passages_used"] == 2
+    assert context.index("a0") < context.index("b0")
+    assert context.startswith("Document 1:\nTitle: Circular 1")
+
+
+def test_empty_passages_are_ignored():
+    context, stats = pack_context([doc(1, ("   ", 1.0))], budget=1000)
+    assert context == ""
+    assert stats["passages_in"] == 0
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from corpus_store import CorpusStore, CorpusWriter, load_corpus_store
+from ingest import build_chunk_records, build_corpus_store
+
+
+def circular(number, *sections):
+    return {
+        "Subject": f"Circular {number}",
+        "Department": "Department of Regulation",
+        "Circular Number": f"RBI/2025/{number}",
+        "Date Of Issue": "24.2.2025",
+        "Meant For": "All Banks",
+        "link": f"https://rbi.org.in/{number}",
+        "details": {"circular": {"contentSections": [
+            {"title": f"Part {i}", "content": text} for i, text in enumerate(sections)
+        ]}},
+    }
+
+
+@pytest.fixture
+def circulars():
+    return [circular(1, "First body ünïcode."), circular(2, "Second body.", "More."), circular(3)]
+
+
+def test_round_trip_matches_ingest_records(tmp_path, circulars):
+    directory = str(tmp_path / "store")
+    build_corpus_store(circulars, directory)
+    store = CorpusStore.load(directory)
+    records = [record for c in circulars for record in build_chunk_records(c)]
+    assert len(store) == len(records)
+    for record in records:
+        payload = store.payload(record["id"])
+        for key in ("parent_id", "chunk_index", "chunk_count", "title", "department", "circular_number",
+                    "date", "date_value", "meant_for", "link", "text", "content_hash"):
+            assert payload[key] == record["payload"][key], key
+    assert [chunk for c in store.iter_circulars() for chunk in c["chunks"]] == records
+    assert store.payload("missing") is None
+    parent = records[0]["payload"]["parent_id"]
+    assert store.circular(parent)["chunks"] == [records[0]["payload"]["text"]]
+
+
+def test_duplicate_circulars_are_stored_once(tmp_path, circulars):
+    writer = CorpusWriter(str(tmp_path / "store"))
+    assert writer.add(build_chunk_records(circulars[0]))
+    assert not writer.add(build_chunk_records(circulars[0]))
+    writer.close()
+    assert CorpusStore.load(str(tmp_path / "store")).meta["circulars"] == 1
+
+
+def test_rebuild_swaps_in_place_and_is_picked_up(tmp_path, circulars):
+    directory = str(tmp_path / "store")
+    build_corpus_store(circulars[:1], directory)
+    old = CorpusStore.load(directory)
+    first_text = old.chunk_texts[0]
+    build_corpus_store(circulars, directory)
+    assert sorted(os.listdir(tmp_path)) == ["store"]
+    # The old mapping still reads, and latest() reopens the rebuilt store
+    assert old.chunk_texts[0] == first_text
+    assert len(old) == 1
+    assert len(old.latest()) == sum(len(build_chunk_records(c)) for c in circulars)
+    assert load_corpus_store(str(tmp_path / "absent")) is None
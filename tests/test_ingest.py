@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+import ingest
+from ingest import iter_json_array
+
+
+def write_json(tmp_path, document):
+    path = tmp_path / "circulars.json"
+    path.write_text(json.dumps(document), encoding="utf-8")
+    return str(path)
+
+
+def test_iter_json_array_streams_the_keyed_array(tmp_path):
+    circulars = [{"Subject": f"Circular {i}", "numbers": [i, i * 1.5]} for i in range(50)]
+    path = write_json(tmp_path, {"title": "RBI", "headers": ["a", {"b": [1, 2]}], "circulars": circulars, "n": 7})
+    assert list(iter_json_array(path)) == circulars
+
+
+def test_iter_json_array_across_read_boundaries(tmp_path, monkeypatch):
+    # Tiny reads force every value, string and number to straddle buffer refills
+    monkeypatch.setattr(ingest, "READ_CHUNK_SIZE", 3)
+    circulars = [{"text": "ünïcode \"quoted\" , ] }", "value": 123456789}, 42, "plain", None]
+    path = write_json(tmp_path, {"circulars": circulars})
+    assert list(iter_json_array(path)) == circulars
+
+
+def test_iter_json_array_missing_or_empty(tmp_path):
+    assert list(iter_json_array(write_json(tmp_path, {"title": "x"}))) == []
+    assert list(iter_json_array(write_json(tmp_path, {"circulars": []}))) == []
+    assert list(iter_json_array(write_json(tmp_path, {}))) == []
+
+
+def test_iter_json_array_rejects_malformed_input(tmp_path):
+    path = tmp_path / "broken.json"
+    path.write_text('["not", "an", "object"]', encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path)))
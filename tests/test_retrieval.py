@@ -0,0 +1,28 @@
+import pytest
+
+from retrieval import Hit, reciprocal_rank_fusion
+
+
+def hits(*ids):
+    return [Hit(point_id, 1.0, {"id": point_id}) for point_id in ids]
+
+
+def test_fusion_rewards_hits_ranked_high_in_every_list():
+    fused = reciprocal_rank_fusion([hits("a", "b", "c"), hits("b", "a", "d")], limit=10)
+    assert [hit.id for hit in fused][:2] in (["a", "b"], ["b", "a"])
+    assert {hit.id for hit in fused} == {"a", "b", "c", "d"}
+    assert fused[0].score > fused[2].score
+
+
+def test_fusion_scales_a_unanimous_first_place_to_one():
+    fused = reciprocal_rank_fusion([hits("a", "b"), hits("a", "c")], limit=1)
+    assert [hit.id for hit in fused] == ["a"]
+    assert fused[0].score == pytest.approx(1.0)
+
+
+def test_fusion_keeps_the_first_payload_and_respects_the_limit():
+    first = [Hit("a", 0.5, {"source": "dense"})]
+    second = [Hit("a", 0.9, {"source": "lexical"}), Hit("b", 0.8, {})]
+    fused = reciprocal_rank_fusion([first, second], limit=1)
+    assert len(fused) == 1
+    assert fused[0].payload == {"source": "dense"}
@@ -0,0 +1,365 @@
+import os
+import json
+import argparse
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+# Configuration
+LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH", ".cache/local_index")
+IVF_NPROBE = int(os.environ.get("LOCAL_INDEX_IVF_NPROBE", "8"))
+# "none", "int8" or "binary"; applies to Qdrant collections at creation and to local indexes
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "none")
+RESCORE_OVERSAMPLING = float(os.environ.get("RESCORE_OVERSAMPLING", "3.0"))
+
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.json"
+PAYLOADS_FILE = "payloads.jsonl"
+CENTROIDS_FILE = "ivf_centroids.npy"
+ASSIGNMENTS_FILE = "ivf_assignments.npy"
+INT8_CODES_FILE = "int8_codes.npy"
+INT8_SCALES_FILE = "int8_scales.npy"
+BINARY_CODES_FILE = "binary_codes.npy"
+QUANTIZED_FILES = {"int8": (INT8_CODES_FILE, INT8_SCALES_FILE), "binary": (BINARY_CODES_FILE,)}
+QUANTIZATION_KINDS = ("none", "int8", "binary")
+
+SCAN_BLOCK_ROWS = 4096
+# Queries scored per matrix product in a batch search, bounding the rows x queries score matrix
+BATCH_QUERY_BLOCK = 64
+INT8_QUANTILE = 0.99
+# Number of set bits in each byte value, for Hamming distances over packed sign bits
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so a dot product is a cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without a full sort."""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class LocalIndexWriter:
+    """Streams vectors and payloads to disk in the layout LocalVectorIndex memory-maps."""
+
+    def __init__(self, directory: str, dim: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dim = dim
+        self.count = 0
+        # A rebuilt matrix invalidates any previously trained clusters and quantized codes
+        for name in (CENTROIDS_FILE, ASSIGNMENTS_FILE, INT8_CODES_FILE, INT8_SCALES_FILE, BINARY_CODES_FILE):
+            if os.path.exists(os.path.join(directory, name)):
+                os.remove(os.path.join(directory, name))
+        self._vectors = open(os.path.join(directory, VECTORS_FILE), "wb")
+        self._payloads = open(os.path.join(directory, PAYLOADS_FILE), "w", encoding="utf-8")
+
+    def add(self, ids: List[Any], vectors: List[List[float]], payloads: List[Dict[str, Any]]) -> None:
+        """Append a batch of points."""
+        matrix = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim))
+        self._vectors.write(matrix.tobytes())
+        for point_id, payload in zip(ids, payloads):
+            self._payloads.write(json.dumps({"id": point_id, "payload": payload}, ensure_ascii=False) + "\n")
+        self.count += len(ids)
+
+    def close(self) -> None:
+        """Flush the files and write the metadata that makes the index loadable."""
+        self._vectors.close()
+        self._payloads.close()
+        with open(os.path.join(self.directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": self.count}, f)
+
+
+class Int8Quantizer:
+    """Per-dimension symmetric int8 codes: 1 byte per dimension instead of 4."""
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray):
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def train(cls, vectors: np.ndarray) -> "Int8Quantizer":
+        # Clip at a high quantile so a few outliers do not waste the code range
+        scales = np.quantile(np.abs(vectors), INT8_QUANTILE, axis=0).astype(np.float32) / 127
+        scales[scales == 0] = 1.0
+        codes = np.empty(vectors.shape, dtype=np.int8)
+        for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS]) / scales
+            codes[start:start + SCAN_BLOCK_ROWS] = np.clip(np.rint(block), -127, 127)
+        return cls(codes, scales)
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate dot products of the query with every row (or the given rows)."""
+        codes = self.codes if rows is None else self.codes[rows]
+        # einsum casts the codes in small buffers instead of materializing a float32 copy of the matrix
+        return np.einsum("ij,j->i", codes, query * self.scales)
+
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+
+class BinaryQuantizer:
+    """Sign bits packed 8 per byte: 1 bit per dimension instead of 32, compared by Hamming distance."""
+
+    def __init__(self, codes: np.ndarray, dim: int):
+        self.codes = codes
+        self.dim = dim
+
+    @classmethod
+    def train(cls, vectors: np.ndarray) -> "BinaryQuantizer":
+        return cls(np.packbits(np.asarray(vectors) > 0, axis=1), vectors.shape[1])
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Similarity in [-1, 1] from the fraction of agreeing signs."""
+        codes = self.codes if rows is None else self.codes[rows]
+        query_bits = np.packbits(query > 0)
+        distances = np.concatenate([
+            POPCOUNT[np.bitwise_xor(codes[start:start + SCAN_BLOCK_ROWS], query_bits)].sum(axis=1)
+            for start in range(0, len(codes), SCAN_BLOCK_ROWS)
+        ]) if len(codes) else np.empty(0, dtype=np.uint16)
+        return 1.0 - 2.0 * distances.astype(np.float32) / self.dim
+
+    def nbytes(self) -> int:
+        return self.codes.nbytes
+
+
+def build_quantized(directory: str, kind: str) -> None:
+    """Quantize an index directory's vectors and store the codes alongside the originals."""
+    index = LocalVectorIndex.load(directory, quantization="none")
+    if kind == "int8":
+        quantizer = Int8Quantizer.train(index.vectors)
+        np.save(os.path.join(directory, INT8_CODES_FILE), quantizer.codes)
+        np.save(os.path.join(directory, INT8_SCALES_FILE), quantizer.scales)
+    elif kind == "binary":
+        np.save(os.path.join(directory, BINARY_CODES_FILE), BinaryQuantizer.train(index.vectors).codes)
+    else:
+        raise ValueError(f"Unknown quantization {kind!r} (expected 'int8' or 'binary')")
+
+
+def load_quantizer(directory: str, kind: str, dim: int):
+    """Memory-map the stored codes of the given kind, or None if they were never built."""
+    if kind == "none":
+        return None
+    if kind not in QUANTIZED_FILES:
+        raise ValueError(f"Unknown quantization {kind!r} (expected one of {QUANTIZATION_KINDS})")
+    paths = [os.path.join(directory, name) for name in QUANTIZED_FILES[kind]]
+    if not all(os.path.exists(path) for path in paths):
+        print(f"No {kind} codes in {directory}; searching full-precision vectors")
+        return None
+    if kind == "int8":
+        return Int8Quantizer(np.load(paths[0], mmap_mode="r"), np.load(paths[1]))
+    return BinaryQuantizer(np.load(paths[0], mmap_mode="r"), dim)
+
+
+class LocalVectorIndex:
+    """In-process cosine search over an L2-normalized float32 matrix memory-mapped from disk.
+
+    With a quantizer, the first pass scores the compact codes, which are all
+    that has to stay resident, and only the best limit * oversampling
+    candidates are rescored against the full-precision rows on disk.
+    """
+
+    def __init__(self, vectors: np.ndarray, ids: List[Any], payloads: List[Dict[str, Any]],
+                 centroids: Optional[np.ndarray] = None, assignments: Optional[np.ndarray] = None,
+                 quantizer=None, oversampling: float = RESCORE_OVERSAMPLING):
+        self.vectors = vectors
+        self.ids = ids
+        self.payloads = payloads
+        self.centroids = centroids
+        self.assignments = assignments
+        self.quantizer = quantizer
+        self.oversampling = oversampling
+        self._lists = None
+        if centroids is not None and assignments is not None:
+            self._lists = [np.flatnonzero(assignments == c) for c in range(len(centroids))]
+
+    @classmethod
+    def load(cls, directory: str = LOCAL_INDEX_PATH, quantization: str = VECTOR_QUANTIZATION) -> "LocalVectorIndex":
+        """Memory-map an index directory written by LocalIndexWriter, with its quantized codes if requested."""
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["count"]:
+            vectors = np.memmap(os.path.join(directory, VECTORS_FILE), dtype=np.float32, mode="r",
+                                shape=(meta["count"], meta["dim"]))
+        else:
+            vectors = np.empty((0, meta["dim"]), dtype=np.float32)
+
+        ids, payloads = [], []
+        with open(os.path.join(directory, PAYLOADS_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                ids.append(record["id"])
+                payloads.append(record["payload"])
+
+        centroids = assignments = None
+        if os.path.exists(os.path.join(directory, CENTROIDS_FILE)):
+            centroids = np.load(os.path.join(directory, CENTROIDS_FILE))
+            assignments = np.load(os.path.join(directory, ASSIGNMENTS_FILE))
+        quantizer = load_quantizer(directory, quantization, meta["dim"])
+        return cls(vectors, ids, payloads, centroids, assignments, quantizer)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query_vector: List[float], limit: int, nprobe: int = IVF_NPROBE,
+               rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Return (row, cosine score) pairs for the limit nearest rows, best first.
+
+        When rows is given only those candidate rows are scored. With an
+        IVF index only the nprobe closest clusters are scored. With a
+        quantizer the candidates are first ranked on the codes and the best
+        are rescored exactly; otherwise the search is exact.
+        """
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32))
+        if rows is None and self._lists is not None and nprobe < len(self._lists):
+            probes = top_k(self.centroids @ query, nprobe)
+            rows = np.concatenate([self._lists[c] for c in probes])
+        if self.quantizer is not None:
+            approximate = self.quantizer.scores(query, rows)
+            candidates = top_k(approximate, max(limit, int(limit * self.oversampling)))
+            rows = candidates if rows is None else rows[candidates]
+            # Sorted rows make the rescoring reads sequential on the memory-mapped originals
+            rows = np.sort(rows)
+        if rows is not None:
+            scores = self.vectors[rows] @ query
+            return [(int(rows[i]), float(scores[i])) for i in top_k(scores, limit)]
+
+        scores = self.vectors @ query
+        return [(int(i), float(scores[i])) for i in top_k(scores, limit)]
+
+    def search_batch(self, query_vectors: List[List[float]], limit: int, nprobe: int = IVF_NPROBE,
+                     rows: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        """search for many queries; exact searches score a block of queries in one matrix product."""
+        queries = normalize_rows(np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1))
+        if self.quantizer is not None or (rows is None and self._lists is not None and nprobe < len(self._lists)):
+            return [self.search(query, limit, nprobe, rows) for query in queries]
+        matrix = self.vectors if rows is None else self.vectors[rows]
+        results = []
+        for start in range(0, len(queries), BATCH_QUERY_BLOCK):
+            scores = matrix @ queries[start:start + BATCH_QUERY_BLOCK].T
+            for column in scores.T:
+                best = top_k(column, limit)
+                row_ids = best if rows is None else rows[best]
+                results.append([(int(row), float(column[i])) for row, i in zip(row_ids, best)])
+        return results
+
+
+def build_ivf(directory: str, nlist: int, iterations: int = 20, seed: int = 0) -> None:
+    """Train a spherical k-means coarse quantizer for an index directory and store it alongside."""
+    index = LocalVectorIndex.load(directory, quantization="none")
+    vectors = np.asarray(index.vectors)
+    nlist = min(nlist, len(vectors))
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = vectors[assignments == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = normalize_rows(centroids)
+    assignments = np.argmax(vectors @ centroids.T, axis=1)
+    np.save(os.path.join(directory, CENTROIDS_FILE), centroids)
+    np.save(os.path.join(directory, ASSIGNMENTS_FILE), assignments)
+
+
+def quantization_report(directory: str, k: int = 10, sample: int = 200, oversampling: float = RESCORE_OVERSAMPLING,
+                        seed: int = 0) -> List[Dict[str, Any]]:
+    """Recall@k against exact search and memory per quantization kind, with and without rescoring.
+
+    Queries are perturbed copies of sampled corpus vectors, so the report
+    needs no embedding calls.
+    """
+    index = LocalVectorIndex.load(directory, quantization="none")
+    vectors = np.asarray(index.vectors)
+    rng = np.random.default_rng(seed)
+    sample_rows = rng.choice(len(vectors), min(sample, len(vectors)), replace=False)
+    noise = rng.normal(scale=1.0 / np.sqrt(vectors.shape[1]), size=(len(sample_rows), vectors.shape[1]))
+    queries = normalize_rows(vectors[sample_rows] + noise.astype(np.float32))
+    exact = [set(top_k(vectors @ query, k).tolist()) for query in queries]
+
+    report = [{"quantization": "none", "bytes": vectors.nbytes, "compression": 1.0,
+               f"recall@{k}": 1.0, f"recall@{k}_rescored": 1.0}]
+    for kind, quantizer_class in (("int8", Int8Quantizer), ("binary", BinaryQuantizer)):
+        quantizer = quantizer_class.train(vectors)
+        raw_hits = rescored_hits = 0
+        for query, truth in zip(queries, exact):
+            approximate = quantizer.scores(query)
+            raw_hits += len(truth & set(top_k(approximate, k).tolist()))
+            candidates = top_k(approximate, max(k, int(k * oversampling)))
+            rescored = candidates[top_k(vectors[candidates] @ query, k)]
+            rescored_hits += len(truth & set(rescored.tolist()))
+        total = len(queries) * min(k, len(vectors))
+        report.append({"quantization": kind, "bytes": quantizer.nbytes(),
+                       "compression": round(vectors.nbytes / quantizer.nbytes(), 1),
+                       f"recall@{k}": round(raw_hits / total, 4), f"recall@{k}_rescored": round(rescored_hits / total, 4)})
+    return report
+
+
+def export_collection(qdrant_client, collection_name: str, directory: str, page_size: int = 256) -> int:
+    """Copy every point of a Qdrant collection into a local index directory."""
+    writer = None
+    offset = None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=collection_name,
+            limit=page_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        if points:
+            if writer is None:
+                writer = LocalIndexWriter(directory, len(points[0].vector))
+            writer.add([str(p.id) for p in points], [p.vector for p in points], [p.payload or {} for p in points])
+        if offset is None:
+            break
+    if writer is None:
+        raise ValueError(f"Collection '{collection_name}' is empty; nothing to export")
+    writer.close()
+    return writer.count
+
+
+def main(argv: List[str] = None) -> None:
+    from qdrant_client import QdrantClient
+
+    parser = argparse.ArgumentParser(description="Export a Qdrant collection to a local memory-mapped index.")
+    parser.add_argument("--out", default=LOCAL_INDEX_PATH)
+    parser.add_argument("--collection", default=os.environ.get("QDRANT_COLLECTION_NAME", "rbi_circulars"))
+    parser.add_argument("--ivf", type=int, default=0, help="Number of IVF clusters to train (0 = exact search only)")
+    parser.add_argument("--quantize", choices=("int8", "binary"),
+                        help="Also store quantized codes (select them at query time with VECTOR_QUANTIZATION)")
+    parser.add_argument("--report", action="store_true", help="Print recall vs memory for each quantization")
+    parser.add_argument("--no-export", action="store_true", help="Reuse the index already in --out")
+    args = parser.parse_args(argv)
+
+    if not args.no_export:
+        qdrant_client = QdrantClient(url=os.environ.get("QDRANT_URL"), api_key=os.environ.get("QDRANT_API_KEY"))
+        count = export_collection(qdrant_client, args.collection, args.out)
+        print(f"Exported {count} points from '{args.collection}' to {args.out}")
+    if args.ivf:
+        build_ivf(args.out, args.ivf)
+        print(f"Trained IVF index with {args.ivf} clusters")
+    if args.quantize:
+        build_quantized(args.out, args.quantize)
+        print(f"Stored {args.quantize} codes")
+    if args.report:
+        for row in quantization_report(args.out):
+            recall_keys = [key for key in row if key.startswith("recall")]
+            print(f"{row['quantization']:7} {row['bytes'] / 2**20:9.2f} MiB  {row['compression']:5.1f}x  "
+                  + "  ".join(f"{key} {row[key]:.4f}" for key in recall_keys))
+
+
+if __name__ == "__main__":
+    main()